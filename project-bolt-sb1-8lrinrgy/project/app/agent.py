@@ -0,0 +1,14 @@
+import os
+from utils.system_monitor import SystemMonitor
+from utils.docker_monitor import DockerMonitor
+from utils.agent import PushAgent
+
+# Lightweight agent for additional machines: collects locally and pushes
+# to the central dashboard's /api/ingest (see AGENT_* in the README)
+if __name__ == '__main__':
+    agent = PushAgent(
+        SystemMonitor(),
+        DockerMonitor(),
+        use_msgpack=os.environ.get('AGENT_MSGPACK', 'true').lower() in ('1', 'true', 'yes')
+    )
+    agent.run()
\ No newline at end of file
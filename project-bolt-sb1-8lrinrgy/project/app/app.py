@@ -1,70 +1,311 @@
 import os
+import hmac
 import json
 import sqlite3
 from datetime import datetime, timedelta
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room
+import psutil
 import threading
 import time
-import requests
 from utils.system_monitor import SystemMonitor
 from utils.docker_monitor import DockerMonitor
-from utils.visitor_tracker import VisitorTracker
+from utils.visitor_tracker import VisitorTracker, BUCKET_SECONDS
+from utils.metrics_history import MetricsHistory, parse_duration
+from utils.metrics_store import MetricsStore
+from utils.channels import Channel, ChannelManager
+from utils.shared_state import SharedState
+from utils.ingest import HostRegistry, IngestError, decode_batch, metric_name
+from utils.http_cache import ResponseCache
+from utils.weather import WeatherService
+from utils.process_monitor import ProcessMonitor, SORT_KEYS
+from utils.export import FORMATS, export_stream
+from utils.container_detail import CONTAINER_LOG_LINES
+from utils.alerts import AlertEngine
+from utils.instrumentation import metrics, EMITS
+from utils.lazy import Lazy
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
 
 # Initialize rate limiter
 limiter = Limiter(
-    app,
-    key_func=get_remote_address,
+    get_remote_address,
+    app=app,
     default_limits=["200 per day", "50 per hour"]
 )
 
-# Initialize SocketIO for real-time updates
-socketio = SocketIO(app, cors_allowed_origins="*")
+# 'standalone' collects and serves from one process. To scale out, run
+# one 'collector' process that samples and publishes to the shared state,
+# and any number of 'web' workers that serve /api/* and Socket.IO from it
+APP_ROLE = os.environ.get('APP_ROLE', 'standalone').lower()
+COLLECTOR = APP_ROLE in ('standalone', 'collector')
 
-# Initialize monitoring components
-system_monitor = SystemMonitor()
-docker_monitor = DockerMonitor()
-visitor_tracker = VisitorTracker()
+# Initialize SocketIO for real-time updates; with several processes a
+# message queue (e.g. redis://) lets any of them emit to every client
+socketio_options = {}
+if os.environ.get('SOCKETIO_MESSAGE_QUEUE'):
+    socketio_options['message_queue'] = os.environ['SOCKETIO_MESSAGE_QUEUE']
+socketio = SocketIO(app, cors_allowed_origins="*", **socketio_options)
+
+def create_visitor_tracker():
+    """Visitor tracker with its tables created, whichever server runs the app"""
+    tracker = VisitorTracker(shared=APP_ROLE == 'web')
+    tracker.init_db()
+    return tracker
+
+# The Docker connection, /proc and /sys readers and visits and metrics
+# databases are built on first use or by the warm-up thread, so
+# importing the app stays fast
+system_monitor = Lazy('system_monitor', SystemMonitor) if COLLECTOR else None
+docker_monitor = Lazy('docker_monitor', DockerMonitor) if COLLECTOR else None
+process_monitor = Lazy('process_monitor', ProcessMonitor) if COLLECTOR else None
+visitor_tracker = Lazy('visitor_tracker', create_visitor_tracker)
+metrics_history = MetricsHistory()
+metrics_store = Lazy('metrics_store', lambda: MetricsStore(read_only=not COLLECTOR))
+shared_state = SharedState() if APP_ROLE != 'standalone' else None
+
+# Other machines push their samples here (see agent.py). Hosts live in
+# this process's memory and the collector serves no HTTP, so only a
+# standalone process can take them
+INGEST = APP_ROLE == 'standalone'
+host_registry = HostRegistry(metrics_history, metrics_store) if INGEST else None
+if os.environ.get('INGEST_TOKEN') and not INGEST:
+    print(f"INGEST_TOKEN is set but ingest needs APP_ROLE=standalone (this process is {APP_ROLE})")
+INGEST_MAX_PENDING = int(os.environ.get('INGEST_MAX_PENDING', 1000))
+
+# Read endpoints serialize each collector tick (or projects file) once
+response_cache = ResponseCache()
+PROJECTS_PATH = 'static/projects.json'
+PROJECTS_MAX_AGE = int(os.environ.get('PROJECTS_MAX_AGE', 300))
+
+weather_service = WeatherService()
+
+def notify_alert(event):
+    """Send an alert state change to every client and web worker"""
+    socketio.emit('alert', event)
+    EMITS.inc(event='alert')
+    if shared_state:
+        shared_state.publish('alerts', alert_engine.snapshot())
+
+# Rules from ALERT_RULES_PATH, evaluated on every system and services sample
+alert_engine = AlertEngine(notify=notify_alert) if COLLECTOR else None
+
+PROCESS_TOP_N = int(os.environ.get('PROCESS_TOP_N', 10))
 
 # Global variables for caching
 cached_system_stats = {}
 cached_services = []
 last_update = datetime.now()
+services_collected = False
+
+def collect_system():
+    """Collect system stats and record them in the history"""
+    global cached_system_stats, last_update
+    
+    if not COLLECTOR:
+        return current_system_stats()
+    
+    cached_system_stats = system_monitor.get_system_stats()
+    last_update = datetime.now()
+    
+    # Keep server-side history so charts survive a page reload
+    metrics_history.record_sample(cached_system_stats, [], last_update.timestamp())
+    metrics_store.record_sample(cached_system_stats, [], last_update.timestamp())
+    alert_engine.observe_sample(cached_system_stats, [], last_update.timestamp())
+    if shared_state:
+        shared_state.publish('system', cached_system_stats)
+    return cached_system_stats
 
-def update_system_data():
-    """Background task to update system data every 10 seconds"""
-    global cached_system_stats, cached_services, last_update
+def collect_services():
+    """Collect Docker services and record them in the history"""
+    global cached_services, services_collected
     
-    while True:
+    if COLLECTOR:
+        cached_services = docker_monitor.get_running_containers()
+        services_collected = True
+        
+        timestamp = time.time()
+        metrics_history.record_sample({}, cached_services, timestamp)
+        metrics_store.record_sample({}, cached_services, timestamp)
+        alert_engine.observe_sample({}, cached_services, timestamp)
+        if shared_state:
+            shared_state.publish('services', cached_services)
+    return {service['id']: service for service in current_services()}
+
+def collect_processes():
+    """Collect the top processes by CPU, memory and IO"""
+    if not COLLECTOR:
+        return shared_state.get('processes', {})
+    
+    processes = process_monitor.snapshot(PROCESS_TOP_N)
+    if shared_state:
+        shared_state.publish('processes', processes)
+    return processes
+
+def collect_visitors():
+    """Collect visitor counters"""
+    return visitor_tracker.get_visitor_stats()
+
+def collect_container(container_id):
+    """Collect a single container's stats"""
+    if COLLECTOR:
+        container = docker_monitor.get_container(container_id)
+    else:
+        # Web workers only see what the collector last published
+        container = next(
+            (service for service in current_services() if service['id'].startswith(container_id)),
+            None
+        )
+    return container or {'error': 'Container not found'}
+
+def current_system_stats():
+    """Latest system stats, from this process or the shared collector"""
+    if APP_ROLE == 'web':
+        return shared_state.get('system', {})
+    return cached_system_stats
+
+def current_services():
+    """Latest Docker services, from this process or the shared collector"""
+    if APP_ROLE == 'web':
+        return shared_state.get('services', [])
+    return cached_services
+
+CHANNELS = {
+    'system': Channel('system', collect_system, interval=10),
+    # Polling Docker's stats takes 1-2 s, so one client can't make the
+    # shared collector run faster than that
+    'services': Channel('services', collect_services, interval=10, min_interval=3),
+    'processes': Channel('processes', collect_processes, interval=5, min_interval=2),
+    'visitors': Channel('visitors', collect_visitors, interval=30)
+}
+
+def resolve_channel(name):
+    """Look up a channel by name, creating per-container channels on demand"""
+    if name in CHANNELS:
+        return CHANNELS[name]
+    if name.startswith('container:'):
+        container_id = name.split(':', 1)[1]
+        # Like services: a one-shot stats call takes 1-2 s
+        return Channel(name, lambda: collect_container(container_id), interval=5, min_interval=3)
+    if name.startswith('container_detail:'):
+        # Sampling needs Docker, which only the collecting process talks to
+        if not COLLECTOR:
+            return None
+        sampler = docker_monitor.watch(name.split(':', 1)[1])
+        if sampler is None:
+            return None
+        # Docker's stats stream has one sample a second, so faster is pointless
+        return Channel(name, sampler.collect, interval=1, min_interval=1, max_interval=10, close=sampler.stop)
+    if name.startswith('host:') and INGEST:
+        host = name.split(':', 1)[1]
+        return Channel(name, lambda: host_registry.get(host) or {'error': 'Unknown host'}, interval=10)
+    return None
+
+# Collectors run for channels with subscribers, at the rate they ask
+# for. System and services keep sampling with nobody watching, so the
+# REST endpoints and history don't go stale: at IDLE_COLLECT_INTERVAL,
+# or every 10 s for alert rules and for a dedicated collector, whose
+# web workers serve its samples. Web workers don't sample at all
+IDLE_COLLECT_INTERVAL = float(os.environ.get('IDLE_COLLECT_INTERVAL', 30))
+pinned_channels = {}
+if COLLECTOR:
+    interval = 10 if APP_ROLE == 'collector' or (alert_engine and alert_engine.rules) else IDLE_COLLECT_INTERVAL
+    pinned_channels = {'system': interval, 'services': interval}
+    if APP_ROLE == 'collector':
+        # Web workers read the process list from the shared state
+        pinned_channels['processes'] = 10
+
+channel_manager = ChannelManager(socketio, resolve_channel, pinned=pinned_channels)
+
+# Background work starts once per process, on the first request or
+# Socket.IO connection or from __main__, so python app.py, gunicorn and
+# flask run all end up the same
+STARTUP_WARMUP = os.environ.get('STARTUP_WARMUP', 'true').lower() in ('1', 'true', 'yes')
+LAZY_RESOURCES = [
+    resource for resource in (system_monitor, process_monitor, docker_monitor, visitor_tracker, metrics_store)
+    if resource is not None
+]
+startup_timings = {}
+startup_lock = threading.Lock()
+started = False
+warmed_up = threading.Event()
+
+def startup_report():
+    """Seconds spent in each startup phase so far"""
+    report = dict(startup_timings)
+    report.update({
+        resource.name: round(resource.seconds, 3)
+        for resource in LAZY_RESOURCES
+        if resource.loaded
+    })
+    return report
+
+def warm_up():
+    """Build the lazy resources ahead of their first use"""
+    started_at = time.perf_counter()
+    for resource in LAZY_RESOURCES:
         try:
-            # Update system stats
-            cached_system_stats = system_monitor.get_system_stats()
-            
-            # Update services
-            cached_services = docker_monitor.get_running_containers()
-            
-            last_update = datetime.now()
-            
-            # Emit to all connected clients
-            socketio.emit('system_update', {
-                'stats': cached_system_stats,
-                'services': cached_services,
-                'timestamp': last_update.isoformat()
-            })
-            
+            resource.load()
         except Exception as e:
-            print(f"Error updating system data: {e}")
-        
-        time.sleep(10)
+            print(f"Error warming up {resource.name}: {e}")
+    
+    geoip_started = time.perf_counter()
+    try:
+        visitor_tracker.geoip()
+    except Exception as e:
+        print(f"Error warming up geoip: {e}")
+    startup_timings['geoip'] = round(time.perf_counter() - geoip_started, 3)
+    startup_timings['warm_up'] = round(time.perf_counter() - started_at, 3)
+    warmed_up.set()
+    print('Warm-up finished: ' + ', '.join(f"{name} {seconds:.3f}s" for name, seconds in startup_report().items()))
+
+def start_background():
+    """Start the channel scheduler and warm-up thread; later calls do nothing"""
+    global started
+    with startup_lock:
+        if started:
+            return
+        started = True
+    
+    channel_manager.start()
+    if STARTUP_WARMUP:
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+    else:
+        warmed_up.set()
 
-# Start background thread
-update_thread = threading.Thread(target=update_system_data, daemon=True)
-update_thread.start()
+def create_app():
+    """Application factory, e.g. gunicorn 'app:create_app()' to start collecting before the first request"""
+    start_background()
+    return app
+
+@app.before_request
+def ensure_started():
+    if not started:
+        start_background()
+
+connected_clients = set()
+metrics.gauge('homelab_socketio_clients', 'Connected Socket.IO clients', lambda: len(connected_clients))
+metrics.gauge('homelab_startup_seconds', 'Seconds spent in each startup phase', startup_report, label='phase')
+metrics.gauge(
+    'homelab_channel_subscribers',
+    'Clients subscribed to each channel',
+    lambda: {name: channel_manager.subscriber_count(name) for name in CHANNELS},
+    label='channel'
+)
+
+def geoip_cache_stats():
+    # Scraping shouldn't be what opens the visits database
+    return visitor_tracker.geo_cache.stats() if visitor_tracker.loaded else {}
+
+def geoip_cache_lookups():
+    stats = geoip_cache_stats()
+    return {'hit': stats.get('hits', 0), 'miss': stats.get('misses', 0)}
+
+metrics.gauge('homelab_geoip_cache_lookups', 'GeoIP cache lookups since startup, by result', geoip_cache_lookups, label='result')
+metrics.gauge('homelab_geoip_cache_entries', 'IP addresses in the GeoIP cache', lambda: geoip_cache_stats().get('size', 0))
 
 @app.route('/')
 def dashboard():
@@ -74,22 +315,287 @@ def dashboard():
 @app.route('/api/system')
 def get_system_stats():
     """Get current system statistics"""
-    return jsonify(cached_system_stats)
+    host = request.args.get('host')
+    if host:
+        if not INGEST:
+            return ingest_unavailable()
+        remote = host_registry.get(host)
+        if remote is None:
+            return jsonify({'error': f"Unknown host: {host}"}), 404
+        return response_cache.response(response_cache.get(f"system:{host}", remote['system']))
+    if COLLECTOR and not cached_system_stats:
+        # Asked before the first tick
+        collect_system()
+    return response_cache.response(response_cache.get('system', current_system_stats()))
 
 @app.route('/api/services')
 def get_services():
     """Get running Docker services"""
-    return jsonify(cached_services)
+    host = request.args.get('host')
+    if host:
+        if not INGEST:
+            return ingest_unavailable()
+        remote = host_registry.get(host)
+        if remote is None:
+            return jsonify({'error': f"Unknown host: {host}"}), 404
+        return response_cache.response(response_cache.get(f"services:{host}", remote['services']))
+    if COLLECTOR and not services_collected:
+        collect_services()
+    return response_cache.response(response_cache.get('services', current_services()))
+
+@app.route('/api/services/<container_id>')
+def get_service_detail(container_id):
+    """Get one container's configuration, resource breakdown and recent logs"""
+    try:
+        lines = min(1000, max(1, int(request.args.get('lines', CONTAINER_LOG_LINES))))
+    except ValueError:
+        return jsonify({'error': 'Invalid lines'}), 400
+    
+    if COLLECTOR:
+        detail = docker_monitor.get_container_detail(container_id, lines)
+    else:
+        # Web workers only have the collector's summary rows
+        detail = next(
+            (service for service in current_services() if service['id'].startswith(container_id)),
+            None
+        )
+    if detail is None:
+        return jsonify({'error': f"Unknown container: {container_id}"}), 404
+    return jsonify(detail)
+
+@app.route('/api/processes')
+def get_processes():
+    """Get the top processes, sorted by cpu, memory or io"""
+    sort = request.args.get('sort', 'cpu')
+    if sort not in SORT_KEYS:
+        return jsonify({'error': f"Unknown sort: {sort}"}), 400
+    try:
+        limit = min(100, max(1, int(request.args.get('limit', PROCESS_TOP_N))))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    
+    if COLLECTOR:
+        summary = process_monitor.collect()
+        processes = process_monitor.top(sort, limit)
+    else:
+        # Web workers only have the collector's top lists
+        summary = dict(shared_state.get('processes', {}))
+        processes = summary.pop(f"top_{sort}", [])[:limit]
+        for other in SORT_KEYS:
+            summary.pop(f"top_{other}", None)
+    
+    summary.update({'sort': sort, 'processes': processes})
+    return jsonify(summary)
+
+@app.route('/metrics')
+@limiter.exempt
+def get_metrics():
+    """Collector instrumentation in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/health')
+@limiter.exempt
+def get_health():
+    """Liveness and startup progress; answers before the heavy resources are built"""
+    return jsonify({
+        'status': 'ok',
+        'role': APP_ROLE,
+        'warmed_up': warmed_up.is_set(),
+        'startup': startup_report()
+    })
+
+@app.route('/api/debug/slow')
+def get_slow_operations():
+    """Get the slowest recent collector operations"""
+    try:
+        limit = min(200, max(1, int(request.args.get('limit', 20))))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    return jsonify(metrics.slowest(limit))
+
+@app.route('/api/alerts')
+def get_alerts():
+    """Get firing alerts and recent alert state changes"""
+    if APP_ROLE == 'web':
+        return jsonify(shared_state.get('alerts', {'rules': 0, 'active': [], 'recent': []}))
+    return jsonify(alert_engine.snapshot())
+
+def ingest_unavailable():
+    return jsonify({'error': 'Remote hosts need APP_ROLE=standalone'}), 501
+
+@app.route('/api/hosts')
+def get_hosts():
+    """Get the remote hosts that push samples to this dashboard"""
+    if not INGEST:
+        return ingest_unavailable()
+    return jsonify(host_registry.hosts())
+
+@app.route('/api/ingest', methods=['POST'])
+@limiter.exempt
+def ingest():
+    """Accept a batch of samples from a remote agent"""
+    token = os.environ.get('INGEST_TOKEN')
+    if not token:
+        return jsonify({'error': 'Ingest is disabled'}), 403
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return jsonify({'error': 'Unauthorized'}), 401
+    if not INGEST:
+        return ingest_unavailable()
+    
+    # Agents keep their samples and retry, so shed load while the
+    # metrics writer is behind rather than queueing without bound
+    if metrics_store.pending() > INGEST_MAX_PENDING:
+        response = jsonify({'error': 'Busy, retry later'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    
+    try:
+        payload = decode_batch(
+            request.get_data(),
+            request.headers.get('Content-Type'),
+            request.headers.get('Content-Encoding')
+        )
+    except IngestError as e:
+        return jsonify({'error': str(e)}), e.status
+    
+    return jsonify({'accepted': host_registry.ingest(payload)})
+
+def export_window():
+    """(start, end) naive datetimes from ?range= or ?start=&end= (ISO 8601); None is open-ended"""
+    if request.args.get('range'):
+        end = datetime.now()
+        return end - timedelta(seconds=parse_duration(request.args['range'])), end
+    start, end = request.args.get('start'), request.args.get('end')
+    return (
+        datetime.fromisoformat(start) if start else None,
+        datetime.fromisoformat(end) if end else None
+    )
+
+def export_response(name, columns, chunks):
+    """Stream an export as CSV or NDJSON (?format=), gzipped with ?gzip=1"""
+    fmt = request.args.get('format', 'csv')
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    filename = f"{name}.{fmt}" + ('.gz' if compress else '')
+    
+    # No Content-Length, so the body goes out with chunked transfer encoding
+    response = Response(
+        export_stream(columns, chunks, fmt, compress),
+        mimetype='application/gzip' if compress else FORMATS[fmt]
+    )
+    response.headers['Content-Disposition'] = f"attachment; filename={filename}"
+    # Stop nginx from buffering the whole export before sending it on
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def export_error():
+    """Error response for a request to an export endpoint, or None if it may proceed"""
+    token = os.environ.get('EXPORT_TOKEN')
+    if not token:
+        return jsonify({'error': 'Export is disabled'}), 403
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return jsonify({'error': 'Unauthorized'}), 401
+    if request.args.get('format', 'csv') not in FORMATS:
+        return jsonify({'error': f"Unknown format: {request.args['format']}"}), 400
+    return None
+
+@app.route('/api/export/visits')
+@limiter.exempt
+def export_visits():
+    """Stream the raw visits table"""
+    error = export_error()
+    if error:
+        return error
+    try:
+        start, end = export_window()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    columns, chunks = visitor_tracker.export_visits(start, end)
+    return export_response('visits', columns, chunks)
+
+@app.route('/api/export/metrics')
+@limiter.exempt
+def export_metrics():
+    """Stream stored metric samples, or rollups with ?resolution=1m|1h"""
+    error = export_error()
+    if error:
+        return error
+    try:
+        start, end = export_window()
+        resolution = request.args.get('resolution')
+        resolution = int(parse_duration(resolution)) if resolution else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if resolution not in (None, 60, 3600):
+        return jsonify({'error': 'Resolution must be 1m or 1h'}), 400
+    
+    # Include samples still waiting for the writer's next batch
+    metrics_store.flush(timeout=5)
+    columns, chunks = metrics_store.export(
+        start.timestamp() if start else None,
+        end.timestamp() if end else None,
+        request.args.get('metric'),
+        resolution
+    )
+    return export_response('metrics', columns, chunks)
+
+@app.route('/api/history')
+def get_history():
+    """Get downsampled history for a metric"""
+    metric = request.args.get('metric')
+    if not metric:
+        return jsonify({'metrics': sorted(set(metrics_store.metrics()) | set(metrics_history.metrics()))})
+    
+    try:
+        range_seconds = parse_duration(request.args.get('range', '1h'))
+        step = request.args.get('step')
+        step = parse_duration(step) if step else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    end = time.time()
+    start = end - range_seconds
+    # Remote hosts' series are stored under their host name
+    host = request.args.get('host')
+    series = metric_name(host, metric) if host else metric
+    
+    # Memory holds everything since startup; older ranges, and series
+    # evicted from memory or never held there, come from disk
+    requested_step = step
+    step, points = None, []
+    covered = metrics_history.covers(start, series)
+    if covered:
+        step, points = metrics_history.query(series, start, end, requested_step)
+    if step is None:
+        step, points = metrics_store.query(series, start, end, requested_step)
+    if step is None and not covered:
+        # Nothing on disk yet (before the first flush); memory has what there is
+        step, points = metrics_history.query(series, start, end, requested_step)
+    if step is None:
+        return jsonify({'error': f"Unknown metric: {series}"}), 404
+    
+    return jsonify({
+        'metric': metric,
+        'host': host,
+        'range': range_seconds,
+        'step': step,
+        'points': points
+    })
+
+def load_projects():
+    with open(PROJECTS_PATH, 'r') as f:
+        return json.load(f)
 
 @app.route('/api/projects')
 def get_projects():
     """Get projects list"""
     try:
-        with open('static/projects.json', 'r') as f:
-            projects = json.load(f)
-        return jsonify(projects)
+        info = os.stat(PROJECTS_PATH)
+        # Re-read the file only when it changes
+        payload = response_cache.get('projects', (info.st_mtime_ns, info.st_size), load_projects)
     except FileNotFoundError:
         return jsonify([])
+    return response_cache.response(payload, max_age=PROJECTS_MAX_AGE)
 
 @app.route('/api/visit', methods=['POST'])
 @limiter.limit("10 per minute")
@@ -104,37 +610,77 @@ def track_visit():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/weather')
-def get_weather():
-    """Get weather data for Tunisia"""
+@app.route('/api/visitors/stats')
+def get_visitor_analytics():
+    """Get visits per bucket, unique visitors and top countries, cities and user agents"""
+    bucket = request.args.get('bucket', 'hour')
+    if bucket not in BUCKET_SECONDS:
+        return jsonify({'error': f"Unknown bucket: {bucket}"}), 400
+    
     try:
-        api_key = os.environ.get('OPENWEATHER_API_KEY')
-        if not api_key:
-            return jsonify({'error': 'API key not configured'}), 500
-        
-        url = f"http://api.openweathermap.org/data/2.5/weather?q=Tunis,TN&appid={api_key}&units=metric"
-        response = requests.get(url, timeout=5)
-        
-        if response.status_code == 200:
-            data = response.json()
-            return jsonify({
-                'temperature': data['main']['temp'],
-                'description': data['weather'][0]['description'],
-                'icon': data['weather'][0]['icon']
-            })
-        else:
-            return jsonify({'error': 'Weather data unavailable'}), 500
+        range_seconds = parse_duration(request.args.get('range', '24h'))
+        top = min(max(int(request.args.get('top', 10)), 1), 100)
+        return jsonify(visitor_tracker.get_visit_analytics(range_seconds, bucket, top))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/weather')
+def get_weather():
+    """Get weather data for the default city, or ?city= from WEATHER_CITIES"""
+    if not weather_service.api_key:
+        return jsonify({'error': 'API key not configured'}), 500
+    
+    city = request.args.get('city')
+    if city and city not in weather_service.cities:
+        return jsonify({'error': f"Unknown city: {city}"}), 404
+    
+    data = weather_service.get(city)
+    if 'error' in data:
+        return jsonify(data), 500
+    return jsonify(data)
+
 @socketio.on('connect')
 def handle_connect():
-    """Handle client connection"""
-    emit('system_update', {
-        'stats': cached_system_stats,
-        'services': cached_services,
-        'timestamp': last_update.isoformat()
-    })
+    """Count connected clients for /metrics"""
+    if not started:
+        # Socket.IO requests don't go through before_request
+        start_background()
+    connected_clients.add(request.sid)
+
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Subscribe to a channel, optionally at a requested interval in seconds"""
+    data = data or {}
+    room = channel_manager.subscribe(request.sid, data.get('channel', ''), data.get('interval'))
+    if room is None:
+        emit('channel_error', {'channel': data.get('channel'), 'error': 'Unknown channel'})
+        return
+    join_room(room)
+    emit('snapshot', channel_manager.snapshot(room))
+    EMITS.inc(event='snapshot')
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data):
+    """Unsubscribe from a channel"""
+    room = channel_manager.unsubscribe(request.sid, (data or {}).get('channel', ''))
+    if room:
+        leave_room(room)
+
+@socketio.on('resync')
+def handle_resync(data):
+    """Send a full snapshot to a client that missed a delta"""
+    room = channel_manager.room_for(request.sid, (data or {}).get('channel', ''))
+    if room:
+        emit('snapshot', channel_manager.snapshot(room))
+        EMITS.inc(event='snapshot')
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    """Drop the client's subscriptions so idle channels stop collecting"""
+    connected_clients.discard(request.sid)
+    channel_manager.disconnect(request.sid)
 
 @app.errorhandler(404)
 def not_found(error):
@@ -144,9 +690,15 @@ def not_found(error):
 def internal_error(error):
     return jsonify({'error': 'Internal server error'}), 500
 
+# From process start to the app being importable
+startup_timings['import'] = round(time.time() - psutil.Process().create_time(), 3)
+
 if __name__ == '__main__':
-    # Create database tables
-    visitor_tracker.init_db()
+    start_background()
     
-    # Run the application
-    socketio.run(app, host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
+    if APP_ROLE == 'collector':
+        # No HTTP server; web workers read what this process publishes
+        channel_manager.join()
+    else:
+        # Run the application
+        socketio.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=False)
\ No newline at end of file
@@ -0,0 +1,192 @@
+import hashlib
+import queue
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+import geoip2.errors
+
+class FakeImage:
+    def __init__(self, tag):
+        self.tags = [tag]
+
+class FakeContainer:
+    """Just enough of docker.models.containers.Container for DockerMonitor"""
+    
+    def __init__(self, index, stats_latency):
+        self.id = hashlib.sha256(str(index).encode()).hexdigest()
+        self.name = f"bench-{index}"
+        self.status = 'running'
+        self.image = FakeImage(f"bench/service-{index % 7}:latest")
+        self.attrs = {
+            'Created': '2024-01-01T00:00:00.000000000Z',
+            'State': {'Status': 'running'}
+        }
+        self.ports = {'80/tcp': [{'HostIp': '0.0.0.0', 'HostPort': str(8000 + index)}]}
+        self.stats_latency = stats_latency
+        self._usage = 0
+    
+    def _sample(self):
+        self._usage += random.randint(10 ** 6, 10 ** 8)
+        return {
+            'cpu_stats': {
+                'cpu_usage': {'total_usage': self._usage, 'percpu_usage': [0, 0, 0, 0]},
+                'system_cpu_usage': self._usage * 20
+            },
+            'precpu_stats': {
+                'cpu_usage': {'total_usage': self._usage // 2, 'percpu_usage': [0, 0, 0, 0]},
+                'system_cpu_usage': self._usage * 10
+            },
+            'memory_stats': {'usage': random.randint(10 ** 7, 10 ** 9), 'limit': 8 * 10 ** 9},
+            'networks': {'eth0': {'rx_bytes': self._usage, 'tx_bytes': self._usage // 3}}
+        }
+    
+    def stats(self, stream=True, decode=False):
+        if not stream:
+            # The daemon blocks a one-shot call while it takes two samples
+            time.sleep(self.stats_latency)
+            return self._sample()
+        return self._stream()
+    
+    def _stream(self):
+        while self.status == 'running':
+            yield self._sample()
+            time.sleep(1)
+    
+    def logs(self, stream=False, follow=False, tail='all', timestamps=False):
+        lines = [
+            f"{datetime.utcnow().isoformat()}Z request {number} served".encode()
+            for number in range(tail if isinstance(tail, int) else 100)
+        ]
+        if stream:
+            stream = FakeEventStream()
+            for line in lines:
+                stream.put(line + b'\n')
+            return stream
+        return b'\n'.join(lines) + b'\n'
+
+class FakeContainers:
+    def __init__(self, containers):
+        self._containers = {container.id: container for container in containers}
+    
+    def list(self):
+        return list(self._containers.values())
+    
+    def get(self, container_id):
+        return self._containers[container_id]
+
+class FakeEventStream:
+    """Blocking events (or log) iterator that, like docker's, can be closed from another thread"""
+    
+    def __init__(self):
+        self._queue = queue.Queue()
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        event = self._queue.get()
+        if event is None:
+            raise StopIteration
+        return event
+    
+    def put(self, event):
+        self._queue.put(event)
+    
+    def close(self):
+        self._queue.put(None)
+
+class FakeDockerClient:
+    """Offline stand-in for docker.DockerClient with N running containers"""
+    
+    def __init__(self, count, stats_latency=0.05):
+        self.containers = FakeContainers([FakeContainer(i, stats_latency) for i in range(count)])
+        self.streams = []
+    
+    def events(self, decode=True, filters=None):
+        stream = FakeEventStream()
+        self.streams.append(stream)
+        return stream
+
+class _Record:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+# (iso code, country, city, lat, lon)
+FAKE_LOCATIONS = [
+    ('TN', 'Tunisia', 'Tunis', 36.8, 10.18),
+    ('FR', 'France', 'Paris', 48.85, 2.35),
+    ('DE', 'Germany', 'Berlin', 52.52, 13.4),
+    ('US', 'United States', 'Ashburn', 39.04, -77.49),
+    ('NL', 'Netherlands', 'Amsterdam', 52.37, 4.9),
+    ('JP', 'Japan', 'Tokyo', 35.68, 139.69),
+    ('BR', 'Brazil', 'Sao Paulo', -23.55, -46.63),
+    ('IN', 'India', 'Mumbai', 19.07, 72.88)
+]
+
+class FakeGeoIPReader:
+    """Deterministic geoip2 Reader replacement with a configurable lookup cost"""
+    
+    def __init__(self, latency=0.0001, miss_ratio=0.05):
+        self.latency = latency
+        self.miss_ratio = miss_ratio
+        self.lookups = 0
+        self._lock = threading.Lock()
+    
+    def city(self, ip_address):
+        with self._lock:
+            self.lookups += 1
+        if self.latency:
+            time.sleep(self.latency)
+        digest = int(hashlib.md5(ip_address.encode()).hexdigest(), 16)
+        if digest % 1000 < self.miss_ratio * 1000:
+            raise geoip2.errors.AddressNotFoundError(f"{ip_address} not found")
+        code, country, city, latitude, longitude = FAKE_LOCATIONS[digest % len(FAKE_LOCATIONS)]
+        return _Record(
+            country=_Record(iso_code=code, name=country),
+            city=_Record(name=city),
+            location=_Record(latitude=latitude, longitude=longitude)
+        )
+
+def random_public_ip(rng):
+    """A random address outside private/reserved ranges"""
+    while True:
+        first = rng.randint(1, 223)
+        if first not in (10, 100, 127, 169, 172, 192, 198, 203):
+            return f"{first}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+
+USER_AGENTS = [
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148',
+    'curl/8.4.0'
+]
+
+def populate_visits(db_path, rows, days=90, distinct_ips=50000, seed=42, chunk=50000):
+    """Fill the visits table with synthetic rows spread over the last days"""
+    rng = random.Random(seed)
+    ips = [random_public_ip(rng) for _ in range(min(distinct_ips, max(rows, 1)))]
+    now = datetime.now()
+    span = days * 86400
+    
+    conn = sqlite3.connect(db_path)
+    try:
+        for start in range(0, rows, chunk):
+            batch = []
+            for _ in range(min(chunk, rows - start)):
+                code, country, city, latitude, longitude = rng.choice(FAKE_LOCATIONS)
+                batch.append((
+                    rng.choice(ips),
+                    now - timedelta(seconds=rng.randrange(span)),
+                    rng.choice(USER_AGENTS),
+                    code, country, city, latitude, longitude
+                ))
+            conn.executemany('''
+                INSERT INTO visits (ip_address, timestamp, user_agent, country_code,
+                                    country_name, city, latitude, longitude)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', batch)
+            conn.commit()
+    finally:
+        conn.close()
\ No newline at end of file
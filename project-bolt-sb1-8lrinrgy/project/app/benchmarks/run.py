@@ -0,0 +1,350 @@
+"""Offline benchmarks for the collectors, visitor tracking and the API
+
+Run from the app directory:
+    
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --compare results.json --threshold 0.2
+
+Docker, GeoIP and the visits table are replaced by fakes (see fakes.py),
+so no daemon, GeoLite2 database or network is needed.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from unittest import mock
+import requests
+from benchmarks.fakes import FakeDockerClient, FakeGeoIPReader, populate_visits, random_public_ip, USER_AGENTS
+
+API_ENDPOINTS = [
+    '/api/health',
+    '/api/system',
+    '/api/services',
+    '/api/processes',
+    '/api/history?metric=cpu.percent&range=1h',
+    '/api/projects',
+    '/api/hosts',
+    '/api/visitors/stats?range=30d&bucket=day'
+]
+
+def percentile(values, percent):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize(seconds):
+    """Latency summary in milliseconds"""
+    return {
+        'p50_ms': round(percentile(seconds, 50) * 1000, 3),
+        'p95_ms': round(percentile(seconds, 95) * 1000, 3),
+        'p99_ms': round(percentile(seconds, 99) * 1000, 3),
+        'mean_ms': round(statistics.mean(seconds) * 1000, 3)
+    }
+
+def result(name, value, unit, better, **details):
+    """One comparable measurement; better is 'lower' or 'higher'"""
+    return dict(name=name, value=value, unit=unit, better=better, **details)
+
+def bench_docker(args):
+    """Refresh-cycle latency of get_running_containers against container count"""
+    from utils.docker_monitor import DockerMonitor
+    
+    results = []
+    for mode in args.docker_modes:
+        for count in args.containers:
+            client = FakeDockerClient(count, stats_latency=args.stats_latency)
+            with mock.patch('utils.docker_monitor.docker.from_env', return_value=client):
+                monitor = DockerMonitor(mode=mode)
+            try:
+                if mode == 'stream':
+                    # Let every stream deliver its first sample
+                    time.sleep(1.5)
+                monitor.get_running_containers()
+                
+                timings = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    containers = monitor.get_running_containers()
+                    timings.append(time.perf_counter() - started)
+                
+                failed = sum(1 for container in containers if 'error' in container or container.get('partial'))
+                summary = summarize(timings)
+                results.append(result(
+                    f"docker.{mode}.containers_{count}", summary['p50_ms'], 'ms', 'lower',
+                    mode=mode, containers=count, failed=failed, **summary
+                ))
+                print(f"docker {mode:6} {count:5} containers: p50 {summary['p50_ms']} ms")
+            finally:
+                monitor.close()
+                monitor._executor.shutdown(wait=False)
+    return results
+
+def bench_visits(args):
+    """track_visit throughput against the size of the visits table"""
+    from utils.visitor_tracker import VisitorTracker
+    
+    results = []
+    for rows in args.visit_rows:
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, 'visitors.db')
+            tracker = VisitorTracker(db_path=db_path)
+            tracker.geoip_reader = FakeGeoIPReader(latency=args.geoip_latency)
+            tracker.init_db()
+            
+            started = time.perf_counter()
+            populate_visits(db_path, rows)
+            # Drop the markers so init_db rebuilds the summaries and rollups from the synthetic rows
+            conn = sqlite3.connect(db_path)
+            conn.execute('DELETE FROM visit_counters')
+            conn.commit()
+            conn.close()
+            tracker.init_db()
+            populate_seconds = time.perf_counter() - started
+            
+            # Mostly new addresses, like a crawler or a busy day
+            visits = args.visits
+            rng = random.Random(rows)
+            addresses = [random_public_ip(rng) for _ in range(visits)]
+            timings = []
+            errors = []
+            lock = threading.Lock()
+            
+            def worker(index):
+                for position in range(index, visits, args.threads):
+                    visit_started = time.perf_counter()
+                    response = tracker.track_visit(addresses[position], USER_AGENTS[position % len(USER_AGENTS)])
+                    elapsed = time.perf_counter() - visit_started
+                    with lock:
+                        timings.append(elapsed)
+                        if 'error' in response:
+                            errors.append(response['error'])
+            
+            started = time.perf_counter()
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            
+            history_started = time.perf_counter()
+            tracker.get_visit_history(days=30)
+            history_ms = round((time.perf_counter() - history_started) * 1000, 3)
+            
+            analytics_started = time.perf_counter()
+            tracker.get_visit_analytics(30 * 86400, 'day')
+            analytics_ms = round((time.perf_counter() - analytics_started) * 1000, 3)
+            
+            throughput = round(visits / elapsed, 1)
+            results.append(result(
+                f"visits.rows_{rows}", throughput, 'visits/s', 'higher',
+                rows=rows, visits=visits, threads=args.threads, errors=len(errors),
+                populate_seconds=round(populate_seconds, 2), visit_history_ms=history_ms,
+                visit_analytics_ms=analytics_ms,
+                **summarize(timings)
+            ))
+            print(f"visits {rows:9} rows: {throughput} visits/s, analytics {analytics_ms} ms")
+    return results
+
+def bench_api(args):
+    """Requests per second of the read endpoints under concurrent load"""
+    from werkzeug.serving import make_server
+    
+    directory = tempfile.mkdtemp(prefix='homelab-bench-')
+    os.environ.setdefault('METRICS_DB_PATH', os.path.join(directory, 'metrics.db'))
+    os.environ.setdefault('VISITS_DB_PATH', os.path.join(directory, 'visitors.db'))
+    os.environ.setdefault('APP_ROLE', 'standalone')
+    
+    client = FakeDockerClient(args.api_containers, stats_latency=args.stats_latency)
+    try:
+        with mock.patch('utils.docker_monitor.docker.from_env', return_value=client):
+            started = time.perf_counter()
+            import app as dashboard
+            import_ms = round((time.perf_counter() - started) * 1000, 3)
+            # Resources are built lazily; build Docker's while the fake client is in place
+            dashboard.docker_monitor.load()
+    except Exception as e:
+        # Recorded rather than skipped so a broken import shows up in the results
+        print(f"api: could not import app: {e}")
+        return [result('api.import', None, 'error', 'lower', error=f"{type(e).__name__}: {e}")]
+    print(f"api import: {import_ms} ms")
+    
+    dashboard.limiter.enabled = False
+    # Fill the caches the way the first channel tick would
+    dashboard.collect_system()
+    dashboard.collect_services()
+    
+    # Per-request access logging would dominate the measurement
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, dashboard.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-server', daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    
+    results = [result('api.import', import_ms, 'ms', 'lower')]
+    try:
+        for endpoint in args.endpoints:
+            timings = []
+            statuses = {}
+            lock = threading.Lock()
+            deadline = time.monotonic() + args.duration
+            
+            def worker():
+                session = requests.Session()
+                session.headers['Accept-Encoding'] = 'gzip'
+                local_timings = []
+                local_statuses = {}
+                while time.monotonic() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        status = session.get(base_url + endpoint, timeout=10).status_code
+                    except requests.RequestException:
+                        status = 'error'
+                    local_timings.append(time.perf_counter() - started)
+                    local_statuses[status] = local_statuses.get(status, 0) + 1
+                with lock:
+                    timings.extend(local_timings)
+                    for status, count in local_statuses.items():
+                        statuses[status] = statuses.get(status, 0) + count
+            
+            started = time.perf_counter()
+            threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            
+            rate = round(len(timings) / elapsed, 1)
+            results.append(result(
+                f"api.{endpoint}", rate, 'req/s', 'higher',
+                endpoint=endpoint, concurrency=args.concurrency, requests=len(timings),
+                statuses={str(status): count for status, count in statuses.items()},
+                **summarize(timings)
+            ))
+            print(f"api {endpoint}: {rate} req/s")
+    finally:
+        server.shutdown()
+    return results
+
+SUITES = {
+    'docker': bench_docker,
+    'visits': bench_visits,
+    'api': bench_api
+}
+
+def environment():
+    """Where the numbers came from"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+def compare(current, baseline, threshold):
+    """List measurements that got worse than the baseline by more than threshold"""
+    previous = {
+        entry['name']: entry
+        for entries in baseline['results'].values()
+        for entry in entries
+    }
+    regressions = []
+    for entries in current['results'].values():
+        for entry in entries:
+            before = previous.get(entry['name'])
+            if before is None or not before['value'] or entry['value'] is None:
+                continue
+            change = (entry['value'] - before['value']) / before['value']
+            if entry['better'] == 'higher':
+                change = -change
+            if change > threshold:
+                regressions.append({
+                    'name': entry['name'],
+                    'baseline': before['value'],
+                    'current': entry['value'],
+                    'unit': entry['unit'],
+                    'worse_by': round(change, 3)
+                })
+    return regressions
+
+def _int_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+def _str_list(value):
+    return [item for item in value.split(',') if item]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suites', type=_str_list, default=list(SUITES), help='comma-separated: docker,visits,api')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown before failing (0.2 = 20%%)')
+    
+    docker_group = parser.add_argument_group('docker')
+    docker_group.add_argument('--containers', type=_int_list, default=[1, 10, 50, 100])
+    docker_group.add_argument('--stats-latency', type=float, default=0.05, help='seconds per one-shot stats call')
+    docker_group.add_argument('--docker-modes', type=_str_list, default=['poll', 'stream'])
+    docker_group.add_argument('--repeat', type=int, default=10)
+    
+    visits_group = parser.add_argument_group('visits')
+    visits_group.add_argument('--visit-rows', type=_int_list, default=[0, 100000, 1000000])
+    visits_group.add_argument('--visits', type=int, default=2000, help='visits tracked per table size')
+    visits_group.add_argument('--threads', type=int, default=8)
+    visits_group.add_argument('--geoip-latency', type=float, default=0.0001)
+    
+    api_group = parser.add_argument_group('api')
+    api_group.add_argument('--endpoints', type=_str_list, default=API_ENDPOINTS)
+    api_group.add_argument('--duration', type=float, default=5, help='seconds per endpoint')
+    api_group.add_argument('--concurrency', type=int, default=16)
+    api_group.add_argument('--api-containers', type=int, default=20)
+    args = parser.parse_args(argv)
+    
+    unknown = [suite for suite in args.suites if suite not in SUITES]
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(unknown)}")
+    
+    report = {'meta': environment(), 'results': {}}
+    report['meta']['arguments'] = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+    for suite in args.suites:
+        report['results'][suite] = SUITES[suite](args)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression['name']}: {regression['baseline']} -> "
+                  f"{regression['current']} {regression['unit']} ({regression['worse_by']:.0%} worse)")
+        if regressions:
+            return 1
+        print('No regressions')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
\ No newline at end of file
@@ -2,6 +2,13 @@
 class Dashboard {
     constructor() {
         this.socket = null;
+        // Per-channel {seq, state, resyncPending}, and what we want to receive
+        this.channels = {};
+        this.subscriptions = {
+            system: 10,
+            services: 10,
+            visitors: 30
+        };
         this.charts = {};
         this.systemData = {
             cpu: [],
@@ -19,6 +26,7 @@ class Dashboard {
         this.trackVisit();
         this.loadWeather();
         this.initCharts();
+        this.loadHistory();
         this.animateElements();
     }
     
@@ -27,12 +35,57 @@ class Dashboard {
         
         this.socket.on('connect', () => {
             console.log('Connected to server');
+            this.channels = {};
+            if (!document.hidden) {
+                this.subscribeAll();
+            }
+        });
+        
+        // Full channel state on subscribe (or resync), then patches against it
+        this.socket.on('snapshot', (data) => {
+            this.channels[data.channel] = {
+                seq: data.seq,
+                state: data.state,
+                resyncPending: false
+            };
+            this.renderChannel(data.channel);
         });
         
-        this.socket.on('system_update', (data) => {
-            this.updateSystemStats(data.stats);
-            this.updateServices(data.services);
-            this.updateLastUpdate(data.timestamp);
+        this.socket.on('delta', (data) => {
+            const channel = this.channels[data.channel];
+            if (!channel) return;
+            
+            if (channel.seq === null || data.base_seq !== channel.seq) {
+                // Missed a patch; ask for a fresh snapshot once
+                if (!channel.resyncPending) {
+                    channel.resyncPending = true;
+                    this.socket.emit('resync', { channel: data.channel });
+                }
+                return;
+            }
+            
+            data.ops.forEach(op => {
+                if (op[1].length === 0) {
+                    channel.state = op[0] === 'set' ? op[2] : {};
+                } else {
+                    this.applyOp(channel.state, op);
+                }
+            });
+            channel.seq = data.seq;
+            this.renderChannel(data.channel);
+        });
+        
+        // Stop updates while the tab is hidden so an idle dashboard costs nothing
+        document.addEventListener('visibilitychange', () => {
+            if (!this.socket.connected) return;
+            if (document.hidden) {
+                Object.keys(this.subscriptions).forEach(channel => {
+                    this.socket.emit('unsubscribe', { channel });
+                });
+                this.channels = {};
+            } else {
+                this.subscribeAll();
+            }
         });
         
         this.socket.on('disconnect', () => {
@@ -40,6 +93,58 @@ class Dashboard {
         });
     }
     
+    subscribeAll() {
+        Object.entries(this.subscriptions).forEach(([channel, interval]) => {
+            this.socket.emit('subscribe', { channel, interval });
+        });
+    }
+    
+    setRate(channel, interval) {
+        // Re-subscribing with a new interval moves us to that rate's room
+        this.subscriptions[channel] = interval;
+        if (this.socket.connected && !document.hidden) {
+            this.socket.emit('subscribe', { channel, interval });
+        }
+    }
+    
+    applyOp(state, [op, path, value]) {
+        let target = state;
+        for (const key of path.slice(0, -1)) {
+            if (typeof target[key] !== 'object' || target[key] === null) {
+                target[key] = {};
+            }
+            target = target[key];
+        }
+        
+        const last = path[path.length - 1];
+        if (op === 'set') {
+            target[last] = value;
+        } else if (op === 'del') {
+            delete target[last];
+        }
+    }
+    
+    renderChannel(name) {
+        const channel = this.channels[name] || {};
+        const state = channel.state;
+        if (!state) return;
+        
+        if (name === 'services') {
+            // Once anything was collected (seq > 0), no containers means
+            // the last one stopped, so show the empty state
+            if (channel.seq > 0) this.updateServices(Object.values(state));
+            return;
+        }
+        if (Object.keys(state).length === 0) return;
+        
+        if (name === 'system') {
+            this.updateSystemStats(state);
+            this.updateLastUpdate(state.timestamp);
+        } else if (name === 'visitors') {
+            this.updateVisitorStats(state);
+        }
+    }
+    
     initCharts() {
         const chartOptions = {
             responsive: true,
@@ -164,6 +269,52 @@ class Dashboard {
         });
     }
     
+    async loadHistory() {
+        // Prefill charts from server-side history so a reload keeps context
+        const range = `${this.maxDataPoints * 10}s`;
+        const fetchMetric = async (metric) => {
+            const response = await fetch(`/api/history?metric=${metric}&range=${range}&step=10s`);
+            if (!response.ok) return [];
+            const data = await response.json();
+            return data.points || [];
+        };
+        
+        try {
+            const [cpu, memory, rx, tx] = await Promise.all([
+                fetchMetric('cpu.percent'),
+                fetchMetric('memory.percent'),
+                fetchMetric('network.bytes_recv_per_sec'),
+                fetchMetric('network.bytes_sent_per_sec')
+            ]);
+            
+            const trim = (values) => values.splice(0, Math.max(0, values.length - this.maxDataPoints));
+            const prefill = (series, points, scale = 1) => {
+                series.unshift(...points.map(p => p.avg / scale));
+                trim(series);
+            };
+            const prefillLabels = (chart, points) => {
+                chart.data.labels.unshift(...points.map(p => new Date(p.t * 1000).toLocaleTimeString()));
+                trim(chart.data.labels);
+            };
+            
+            prefill(this.systemData.cpu, cpu);
+            prefill(this.systemData.memory, memory);
+            prefill(this.systemData.network.rx, rx, 1024 * 1024);
+            prefill(this.systemData.network.tx, tx, 1024 * 1024);
+            prefillLabels(this.charts.cpu, cpu);
+            prefillLabels(this.charts.memory, memory);
+            prefillLabels(this.charts.network, rx);
+            
+            this.charts.cpu.data.datasets[0].data = [...this.systemData.cpu];
+            this.charts.memory.data.datasets[0].data = [...this.systemData.memory];
+            this.charts.network.data.datasets[0].data = [...this.systemData.network.rx];
+            this.charts.network.data.datasets[1].data = [...this.systemData.network.tx];
+            Object.values(this.charts).forEach(chart => chart.update('none'));
+        } catch (error) {
+            console.error('Error loading history:', error);
+        }
+    }
+    
     updateSystemStats(stats) {
         if (!stats || stats.error) return;
         
@@ -198,8 +349,8 @@ class Dashboard {
         this.charts.memory.update('none');
         
         // Update Network chart
-        const rxMB = stats.network.bytes_recv / (1024 * 1024);
-        const txMB = stats.network.bytes_sent / (1024 * 1024);
+        const rxMB = (stats.network.bytes_recv_per_sec || 0) / (1024 * 1024);
+        const txMB = (stats.network.bytes_sent_per_sec || 0) / (1024 * 1024);
         
         this.systemData.network.rx.push(rxMB);
         this.systemData.network.tx.push(txMB);
@@ -356,10 +507,7 @@ class Dashboard {
                 return;
             }
             
-            // Update visitor stats
-            document.getElementById('total-visits').textContent = data.total_visits;
-            document.getElementById('unique-visitors').textContent = data.unique_visitors;
-            document.getElementById('recent-visits').textContent = data.recent_visits;
+            this.updateVisitorStats(data);
             
             if (data.last_visitor && data.last_visitor.country_name) {
                 document.getElementById('last-visitor').textContent = data.last_visitor.country_name;
@@ -370,6 +518,12 @@ class Dashboard {
         }
     }
     
+    updateVisitorStats(stats) {
+        document.getElementById('total-visits').textContent = stats.total_visits;
+        document.getElementById('unique-visitors').textContent = stats.unique_visitors;
+        document.getElementById('recent-visits').textContent = stats.recent_visits;
+    }
+    
     async loadWeather() {
         try {
             const response = await fetch('/api/weather');
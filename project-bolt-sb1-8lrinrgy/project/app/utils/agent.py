@@ -0,0 +1,140 @@
+import os
+import platform
+import threading
+import time
+from collections import deque
+from itertools import islice
+import requests
+from utils.ingest import MSGPACK_TYPE, encode_batch
+from utils.metrics_history import flatten_sample
+
+class PushAgent:
+    """Collect local stats and push them in batches to a central dashboard
+    
+    Samples are buffered until the central instance acknowledges them, so
+    nothing is lost while it restarts. When it is down or asks us to slow
+    down (429/503 with Retry-After) pushes back off exponentially; if the
+    outage outlasts the buffer the oldest samples are dropped first.
+    """
+    
+    def __init__(self, system_monitor, docker_monitor, central_url=None, host=None, token=None,
+                 interval=None, max_batch=None, buffer_size=None, use_msgpack=True):
+        self.system_monitor = system_monitor
+        self.docker_monitor = docker_monitor
+        self.central_url = (central_url or os.environ.get('AGENT_CENTRAL_URL', 'http://localhost:5000')).rstrip('/')
+        self.host = host or os.environ.get('AGENT_HOST', platform.node())
+        self.token = token or os.environ.get('AGENT_TOKEN', '')
+        self.interval = interval or float(os.environ.get('AGENT_INTERVAL', 10))
+        self.max_batch = max_batch or int(os.environ.get('AGENT_MAX_BATCH', 500))
+        self.use_msgpack = use_msgpack
+        
+        # One day of samples at the default interval
+        self.buffer = deque(maxlen=buffer_size or int(os.environ.get('AGENT_BUFFER_SIZE', 8640)))
+        self.latest = None
+        self._lock = threading.Lock()
+        self._pending = threading.Event()
+        
+        self.backoff = 0
+        self.max_backoff = 300
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f"Bearer {self.token}"
+    
+    def collect(self):
+        """Take one sample and queue it for the next push"""
+        stats = self.system_monitor.get_system_stats()
+        services = self.docker_monitor.get_running_containers()
+        with self._lock:
+            self.buffer.append({
+                'ts': time.time(),
+                'metrics': flatten_sample(stats, services)
+            })
+            self.latest = (stats, services)
+        self._pending.set()
+    
+    def push(self):
+        """Send the oldest buffered samples; returns seconds to wait before the next push"""
+        with self._lock:
+            samples = list(islice(self.buffer, self.max_batch))
+            stats, services = self.latest or ({}, [])
+        if not samples:
+            return None
+        
+        body, content_type = encode_batch({
+            'host': self.host,
+            'samples': samples,
+            'system': stats,
+            'services': services
+        }, self.use_msgpack)
+        
+        try:
+            response = self.session.post(
+                f"{self.central_url}/api/ingest",
+                data=body,
+                headers={'Content-Type': content_type, 'Content-Encoding': 'gzip'},
+                timeout=10
+            )
+        except requests.RequestException as e:
+            print(f"Push to {self.central_url} failed: {e}")
+            return self._back_off()
+        
+        if response.status_code == 413 and len(samples) > 1:
+            # Retry the same samples in smaller batches
+            self.max_batch = max(1, len(samples) // 2)
+            return 0
+        if response.status_code == 415 and content_type == MSGPACK_TYPE:
+            # The central instance can't read msgpack; resend the same samples as JSON
+            print("Central does not accept msgpack; switching to JSON")
+            self.use_msgpack = False
+            return 0
+        if response.status_code in (429, 503):
+            return self._back_off(response.headers.get('Retry-After'))
+        if response.status_code >= 400:
+            print(f"Central rejected batch ({response.status_code}): {response.text[:200]}")
+            if response.status_code in (400, 413):
+                # Retrying an unacceptable batch would block everything behind it
+                self._acknowledge(samples)
+            return self._back_off()
+        
+        self._acknowledge(samples)
+        self.backoff = 0
+        # Keep draining a backlog without waiting for the next sample
+        return 0 if len(self.buffer) else None
+    
+    def _acknowledge(self, samples):
+        """Drop samples the central instance has taken"""
+        # The buffer may have evicted some of them meanwhile; what is left
+        # of the batch is still at the front
+        sent = set(map(id, samples))
+        with self._lock:
+            while self.buffer and id(self.buffer[0]) in sent:
+                self.buffer.popleft()
+    
+    def _back_off(self, retry_after=None):
+        self.backoff = min(self.max_backoff, max(self.interval, self.backoff * 2))
+        try:
+            return max(self.backoff, float(retry_after)) if retry_after else self.backoff
+        except ValueError:
+            return self.backoff
+    
+    def _push_loop(self):
+        while True:
+            self._pending.wait()
+            self._pending.clear()
+            while True:
+                wait = self.push()
+                if wait is None:
+                    break
+                if wait:
+                    time.sleep(wait)
+    
+    def run(self):
+        """Collect every interval and push from a background thread"""
+        threading.Thread(target=self._push_loop, name='agent-push', daemon=True).start()
+        print(f"Agent {self.host} pushing to {self.central_url} every {self.interval:g}s")
+        while True:
+            started = time.monotonic()
+            try:
+                self.collect()
+            except Exception as e:
+                print(f"Error collecting sample: {e}")
+            time.sleep(max(0, self.interval - (time.monotonic() - started)))
\ No newline at end of file
@@ -0,0 +1,404 @@
+import fnmatch
+import json
+import math
+import operator
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from utils.metrics_history import flatten_sample, parse_duration
+from utils.instrumentation import metrics
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le
+}
+
+# What a metric rule compares: the latest sample, an aggregate over its
+# window, or how many standard deviations the sample is from its EWMA
+AGGREGATES = ('last', 'avg', 'min', 'max', 'zscore')
+
+ALERT_EVENTS = metrics.counter('homelab_alerts_total', 'Alert state changes')
+ALERT_SUPPRESSED = metrics.counter('homelab_alerts_suppressed_total', 'Alert notifications dropped by rate limiting')
+
+def _seconds(value, default=0):
+    if value is None:
+        return default
+    return parse_duration(value) if isinstance(value, str) else float(value)
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts).isoformat(timespec='seconds') if ts else None
+
+class Rule:
+    """One alert rule
+    
+    Metric rules match flattened series names (e.g. 'container.*.cpu_percent')
+    and fire once the condition has held for 'for' seconds. Restart rules
+    match container names and fire when a container is restarted or recreated.
+    """
+    
+    def __init__(self, spec):
+        self.name = spec['name']
+        self.severity = spec.get('severity', 'warning')
+        self.restart = spec.get('restart')
+        self.metric = spec.get('metric')
+        if bool(self.restart) == bool(self.metric):
+            raise ValueError(f"Rule {self.name} needs exactly one of 'metric' or 'restart'")
+        
+        if self.restart:
+            # Restarts are instants; the alert clears after a quiet period
+            self.resolve_after = _seconds(spec.get('resolve_after'), 600)
+            self.aggregate = None
+            return
+        
+        self.op = spec.get('op', '>')
+        if self.op not in OPERATORS:
+            raise ValueError(f"Rule {self.name}: unknown operator {self.op}")
+        self.compare = OPERATORS[self.op]
+        self.threshold = float(spec['threshold'])
+        # A firing alert only resolves once past 'clear', so a value
+        # hovering around the threshold doesn't flap
+        self.clear = float(spec['clear']) if spec.get('clear') is not None else self.threshold
+        self.for_seconds = _seconds(spec.get('for'))
+        self.aggregate = spec.get('aggregate', 'last')
+        if self.aggregate not in AGGREGATES:
+            raise ValueError(f"Rule {self.name}: unknown aggregate {self.aggregate}")
+        self.window = _seconds(spec.get('window'), 300)
+        self.alpha = float(spec.get('alpha', 0.1))
+        self.warmup = int(spec.get('warmup', 30))
+    
+    def matches(self, series):
+        return fnmatch.fnmatchcase(series, self.metric)
+    
+    def breached(self, value, active):
+        """Whether value breaches the rule; firing alerts are held until they pass 'clear'"""
+        if value is None:
+            return active
+        return self.compare(value, self.clear if active else self.threshold)
+
+class _Window:
+    """Sliding window of samples with O(1) amortized avg, min and max"""
+    
+    __slots__ = ('seconds', 'samples', 'total', 'mins', 'maxs')
+    
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.samples = deque()
+        self.total = 0.0
+        # Monotonic deques: the front is always the window's min / max
+        self.mins = deque()
+        self.maxs = deque()
+    
+    def add(self, ts, value):
+        self.samples.append((ts, value))
+        self.total += value
+        while self.mins and self.mins[-1][1] >= value:
+            self.mins.pop()
+        self.mins.append((ts, value))
+        while self.maxs and self.maxs[-1][1] <= value:
+            self.maxs.pop()
+        self.maxs.append((ts, value))
+        
+        cutoff = ts - self.seconds
+        while self.samples[0][0] <= cutoff:
+            self.total -= self.samples.popleft()[1]
+        while self.mins[0][0] <= cutoff:
+            self.mins.popleft()
+        while self.maxs[0][0] <= cutoff:
+            self.maxs.popleft()
+    
+    def value(self, aggregate):
+        if aggregate == 'avg':
+            return self.total / len(self.samples)
+        if aggregate == 'min':
+            return self.mins[0][1]
+        return self.maxs[0][1]
+
+class _Ewma:
+    """Exponentially weighted mean and variance for z-scores"""
+    
+    __slots__ = ('alpha', 'warmup', 'mean', 'variance', 'count')
+    
+    def __init__(self, alpha, warmup):
+        self.alpha = alpha
+        self.warmup = warmup
+        self.mean = None
+        self.variance = 0.0
+        self.count = 0
+    
+    def zscore(self, value):
+        """Score a sample against the history before it, then add it"""
+        score = None
+        if self.mean is None:
+            self.mean = value
+        else:
+            if self.count >= self.warmup and self.variance > 0:
+                score = abs(value - self.mean) / math.sqrt(self.variance)
+            diff = value - self.mean
+            increment = self.alpha * diff
+            self.mean += increment
+            self.variance = (1 - self.alpha) * (self.variance + diff * increment)
+        self.count += 1
+        return score
+
+class _State:
+    """Evaluation state of one rule for one series"""
+    
+    __slots__ = ('window', 'ewma', 'pending_since', 'alert', 'last_seen', 'last_notified')
+    
+    def __init__(self, rule):
+        self.window = _Window(rule.window) if rule.aggregate in ('avg', 'min', 'max') else None
+        self.ewma = _Ewma(rule.alpha, rule.warmup) if rule.aggregate == 'zscore' else None
+        self.pending_since = None
+        self.alert = None
+        self.last_seen = None
+        self.last_notified = 0
+    
+    def observe(self, rule, ts, value):
+        """The value the rule compares for this sample"""
+        self.last_seen = ts
+        if self.window is not None:
+            self.window.add(ts, value)
+            return self.window.value(rule.aggregate)
+        if self.ewma is not None:
+            return self.ewma.zscore(value)
+        return value
+
+class AlertEngine:
+    """Evaluate alert rules incrementally on every collector sample
+    
+    Each (rule, series) pair keeps a small state (pending time, sliding
+    window or EWMA), so a sample costs one update per matching rule and
+    nothing is read back from the history. Which rules match a series is
+    worked out once per series name. Only state changes are notified,
+    and notifications are rate limited per alert and overall.
+    """
+    
+    def __init__(self, rules_path=None, notify=None, renotify_interval=None, max_events_per_minute=None,
+                 stale_after=None, history_size=200):
+        self.rules_path = rules_path or os.environ.get('ALERT_RULES_PATH', 'data/alerts.json')
+        # notify(event) is called outside the lock for every notification
+        self.notify = notify
+        # An alert that resolves and fires again within this many seconds isn't notified again
+        self.renotify_interval = renotify_interval or float(os.environ.get('ALERT_RENOTIFY_INTERVAL', 300))
+        self.max_events_per_minute = max_events_per_minute or int(os.environ.get('ALERT_MAX_EVENTS_PER_MINUTE', 60))
+        # Series that stop reporting (e.g. a removed container) resolve after this
+        self.stale_after = stale_after or float(os.environ.get('ALERT_STALE_AFTER', 300))
+        
+        self.rules = self.load_rules(self.rules_path)
+        self._metric_rules = [rule for rule in self.rules if rule.metric]
+        self._restart_rules = [rule for rule in self.rules if rule.restart]
+        self._rules_by_series = {}
+        self._states = {}
+        self._containers = {}
+        self._recent = deque(maxlen=history_size)
+        self._sent = deque()
+        self._last_sweep = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def load_rules(path):
+        """Load rules from a JSON list; invalid rules are skipped"""
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path) as f:
+                specs = json.load(f)
+        except Exception as e:
+            print(f"Error loading alert rules from {path}: {e}")
+            return []
+        
+        rules = []
+        names = set()
+        for spec in specs:
+            try:
+                rule = Rule(spec)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Skipping alert rule {spec.get('name', '?') if isinstance(spec, dict) else spec}: {e}")
+                continue
+            if rule.name in names:
+                print(f"Skipping duplicate alert rule {rule.name}")
+                continue
+            names.add(rule.name)
+            rules.append(rule)
+        return rules
+    
+    def observe_sample(self, stats, services, ts=None):
+        """Evaluate one collector tick of system stats and container services"""
+        if not self.rules:
+            return
+        ts = ts or time.time()
+        events = []
+        with self._lock:
+            for series, value in flatten_sample(stats, services).items():
+                for rule in self._rules_for(series):
+                    self._evaluate(rule, series, value, ts, events)
+            if services and self._restart_rules:
+                self._check_restarts(services, ts, events)
+            if ts - self._last_sweep >= 60:
+                self._sweep(ts, events)
+                self._last_sweep = ts
+        
+        if self.notify is not None:
+            for event in events:
+                try:
+                    self.notify(event)
+                except Exception as e:
+                    print(f"Error sending alert {event['id']}: {e}")
+    
+    def _rules_for(self, series):
+        rules = self._rules_by_series.get(series)
+        if rules is None:
+            rules = self._rules_by_series[series] = tuple(
+                rule for rule in self._metric_rules if rule.matches(series)
+            )
+        return rules
+    
+    def _evaluate(self, rule, series, value, ts, events):
+        key = (rule.name, series)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = _State(rule)
+        observed = state.observe(rule, ts, value)
+        
+        if rule.breached(observed, state.alert is not None):
+            if state.pending_since is None:
+                state.pending_since = ts
+            if state.alert is None and ts - state.pending_since >= rule.for_seconds:
+                state.alert = self._alert(rule, series, observed, state.pending_since)
+                self._transition(state, 'firing', ts, events)
+            elif state.alert is not None:
+                state.alert['value'] = round(observed, 2)
+        else:
+            state.pending_since = None
+            if state.alert is not None:
+                state.alert['value'] = None if observed is None else round(observed, 2)
+                self._transition(state, 'resolved', ts, events)
+    
+    def _check_restarts(self, services, ts, events):
+        """Fire restart rules for containers started again since the last sample"""
+        for service in services:
+            name = service.get('name')
+            if name is None:
+                continue
+            # A restart changes the start time and count, a recreate the id
+            marker = (service.get('id'), service.get('started_at'), service.get('restart_count'))
+            previous = self._containers.get(name)
+            self._containers[name] = (marker, ts)
+            if previous is None or previous[0] == marker:
+                continue
+            for rule in self._restart_rules:
+                if not fnmatch.fnmatchcase(name, rule.restart):
+                    continue
+                key = (rule.name, name)
+                state = self._states.get(key)
+                if state is None:
+                    state = self._states[key] = _State(rule)
+                state.last_seen = ts
+                if state.alert is None:
+                    state.alert = self._alert(rule, name, None, ts)
+                    self._transition(state, 'firing', ts, events)
+                else:
+                    state.alert['restarts'] = state.alert.get('restarts', 1) + 1
+    
+    def _sweep(self, ts, events):
+        """Resolve restart alerts past resolve_after and series that stopped reporting"""
+        rules = {rule.name: rule for rule in self.rules}
+        for key, state in list(self._states.items()):
+            rule = rules[key[0]]
+            quiet = ts - (state.last_seen or ts)
+            if rule.restart:
+                expired = quiet >= rule.resolve_after
+            else:
+                expired = quiet >= self.stale_after
+            if not expired:
+                continue
+            if state.alert is not None:
+                self._transition(state, 'resolved', ts, events)
+            del self._states[key]
+        
+        self._containers = {
+            name: entry for name, entry in self._containers.items() if ts - entry[1] < self.stale_after
+        }
+    
+    def _alert(self, rule, series, value, started):
+        if rule.restart:
+            message = f"{series} restarted"
+        else:
+            label = series if rule.aggregate == 'last' else f"{rule.aggregate}({series})"
+            message = f"{label} {rule.op} {rule.threshold:g}"
+        return {
+            'id': f"{rule.name}:{series}",
+            'rule': rule.name,
+            'series': series,
+            'severity': rule.severity,
+            'state': 'firing',
+            'value': None if value is None else round(value, 2),
+            'threshold': None if rule.restart else rule.threshold,
+            'message': message,
+            'started_at': _iso(started),
+            'resolved_at': None
+        }
+    
+    def _transition(self, state, new_state, ts, events):
+        """Record a firing/resolved change and queue its notification"""
+        alert = state.alert
+        alert['state'] = new_state
+        if new_state == 'resolved':
+            alert['resolved_at'] = _iso(ts)
+            state.alert = None
+        ALERT_EVENTS.inc(state=new_state, severity=alert['severity'])
+        
+        # Dedup flapping: a re-fire soon after the last notification stays
+        # quiet, as does one over the rate limit. Whether the firing was
+        # sent decides its resolve, so receivers get both or neither
+        if new_state == 'firing':
+            reason = None
+            if ts - state.last_notified < self.renotify_interval:
+                reason = 'renotify'
+            elif not self._allow():
+                reason = 'rate_limit'
+            alert['notified'] = reason is None
+            if reason:
+                ALERT_SUPPRESSED.inc(reason=reason)
+            else:
+                state.last_notified = ts
+        elif alert.get('notified'):
+            # Always sent, but counted against the limit for later firings
+            self._allow(force=True)
+        record = {key: value for key, value in alert.items() if key != 'notified'}
+        self._recent.append(record)
+        if alert.get('notified'):
+            events.append(dict(record))
+    
+    def _allow(self, force=False):
+        """Whether one more notification fits in max_events_per_minute"""
+        now = time.monotonic()
+        while self._sent and now - self._sent[0] >= 60:
+            self._sent.popleft()
+        if len(self._sent) >= self.max_events_per_minute and not force:
+            return False
+        self._sent.append(now)
+        return True
+    
+    def active(self):
+        """Alerts currently firing, most severe first"""
+        order = {'critical': 0, 'warning': 1, 'info': 2}
+        with self._lock:
+            alerts = [dict(state.alert) for state in self._states.values() if state.alert is not None]
+        for alert in alerts:
+            alert.pop('notified', None)
+        return sorted(alerts, key=lambda alert: (order.get(alert['severity'], 3), alert['started_at'] or ''))
+    
+    def snapshot(self, limit=50):
+        """Active alerts plus the most recent state changes"""
+        with self._lock:
+            recent = list(self._recent)[-limit:]
+        return {
+            'rules': len(self.rules),
+            'active': self.active(),
+            'recent': recent[::-1]
+        }
\ No newline at end of file
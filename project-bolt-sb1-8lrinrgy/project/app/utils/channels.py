@@ -0,0 +1,376 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.delta import DeltaEncoder
+from utils.instrumentation import (
+    metrics, CHANNEL_SECONDS, CHANNEL_LAG, CHANNEL_OVERRUNS, CHANNEL_DEADLINE_MISSES,
+    CHANNEL_COALESCED, COLLECTOR_ERRORS, EMITS
+)
+
+def _kind(name):
+    """Metric label for a channel; 'container:<id>' channels share one"""
+    return name.split(':', 1)[0]
+
+class Channel:
+    """A named stream of state produced by a collector function"""
+    
+    def __init__(self, name, collect, interval=10, min_interval=1, max_interval=300, deadline=None, close=None):
+        self.name = name
+        self.collect = collect
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        # Seconds a collection may take before it is reported as late;
+        # defaults to a few of the periods it runs at
+        self.deadline = deadline
+        # Called once the last subscriber has left, to release what collect holds open
+        self.close = close
+    
+    def clamp(self, interval):
+        """Limit a client-requested update interval to what this channel allows"""
+        try:
+            interval = float(interval)
+        except (TypeError, ValueError):
+            return self.interval
+        return min(self.max_interval, max(self.min_interval, interval))
+
+class ChannelManager:
+    """Run channel collectors only while clients are subscribed to them
+    
+    Each (channel, interval) pair is a Socket.IO room with its own delta
+    encoder, so clients that asked for different rates get consistent
+    patches. A channel's collector runs at the fastest rate any of its
+    rooms needs; with no subscribers nothing is collected at all, apart
+    from channels pinned to keep running for history.
+    
+    Every active channel is an asyncio task on the scheduler thread's
+    event loop. Collectors run concurrently in a thread pool on fixed
+    ticks (a random phase per channel, no drift), so a slow Docker call
+    only delays its own channel. Broadcasting is a second task per
+    channel: if emitting falls behind, newer updates replace the one
+    waiting instead of queueing up.
+    """
+    
+    def __init__(self, socketio, resolve, pinned=None, workers=None, emit_workers=None, jitter=None):
+        self.socketio = socketio
+        # resolve(name) -> Channel or None; lets channels like
+        # 'container:<id>' be created on demand
+        self.resolve = resolve
+        self.pinned = dict(pinned or {})
+        # Fraction of the period a channel's ticks are offset by at random
+        self.jitter = float(jitter if jitter is not None else os.environ.get('CHANNEL_JITTER', 0.1))
+        # Periods a collection may take before it counts as a deadline miss
+        self.deadline_periods = float(os.environ.get('CHANNEL_DEADLINE_PERIODS', 3))
+        
+        self._channels = {}
+        self._rooms = {}
+        self._subscriptions = {}
+        self._last_data = {}
+        self._lock = threading.RLock()
+        self._thread = None
+        
+        self._collect_executor = ThreadPoolExecutor(
+            max_workers=int(workers or os.environ.get('CHANNEL_WORKERS', 8)),
+            thread_name_prefix='channel-collect'
+        )
+        self._emit_executor = ThreadPoolExecutor(
+            max_workers=int(emit_workers or os.environ.get('CHANNEL_EMIT_WORKERS', 4)),
+            thread_name_prefix='channel-emit'
+        )
+        # Only touched on the event loop
+        self._loop = None
+        self._changed = None
+        self._tasks = {}
+        self._pending = {}
+    
+    def start(self):
+        """Start the scheduler thread; later calls do nothing"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='channel-scheduler', daemon=True)
+                self._thread.start()
+    
+    def join(self):
+        """Block until the scheduler thread exits"""
+        if self._thread is not None:
+            self._thread.join()
+    
+    def subscribe(self, sid, name, interval=None):
+        """Register a subscription; returns the room the client should join"""
+        with self._lock:
+            channel = self._channels.get(name) or self.resolve(name)
+            if channel is None:
+                return None
+            self._channels[name] = channel
+            
+            interval = channel.clamp(interval if interval is not None else channel.interval)
+            room = f"{name}@{interval:g}"
+            previous = self._subscriptions.get(sid, {}).get(name)
+            
+            if room not in self._rooms:
+                encoder = DeltaEncoder()
+                if name in self._last_data:
+                    encoder.update(self._last_data[name])
+                self._rooms[room] = {
+                    'channel': name,
+                    'interval': interval,
+                    'members': set(),
+                    'encoder': encoder,
+                    # A room without data yet is collected right away
+                    'next_due': 0 if name not in self._last_data else time.monotonic() + interval
+                }
+            self._rooms[room]['members'].add(sid)
+            self._subscriptions.setdefault(sid, {})[name] = room
+            
+            # Moving to a different rate leaves the old room; only now,
+            # so the channel isn't closed for having no rooms in between
+            if previous and previous != room:
+                self._leave(sid, previous)
+        
+        self._notify()
+        return room
+    
+    def unsubscribe(self, sid, name):
+        """Drop one subscription; returns the room the client should leave"""
+        with self._lock:
+            room = self._subscriptions.get(sid, {}).pop(name, None)
+            if room:
+                self._leave(sid, room)
+        self._notify()
+        return room
+    
+    def disconnect(self, sid):
+        """Drop every subscription of a disconnected client"""
+        with self._lock:
+            for room in self._subscriptions.pop(sid, {}).values():
+                self._leave(sid, room)
+        self._notify()
+    
+    def snapshot(self, room):
+        """Full state of a room for a newly subscribed or resyncing client"""
+        with self._lock:
+            entry = self._rooms.get(room)
+            if entry is None:
+                return None
+            snapshot = entry['encoder'].snapshot()
+            snapshot['channel'] = entry['channel']
+            return snapshot
+    
+    def room_for(self, sid, name):
+        with self._lock:
+            return self._subscriptions.get(sid, {}).get(name)
+    
+    def subscriber_count(self, name=None):
+        """Number of subscribed clients, overall or for one channel"""
+        with self._lock:
+            if name is None:
+                return len(self._subscriptions)
+            return sum(1 for rooms in self._subscriptions.values() if name in rooms)
+    
+    def _leave(self, sid, room):
+        entry = self._rooms.get(room)
+        if entry is None:
+            return
+        entry['members'].discard(sid)
+        if not entry['members']:
+            del self._rooms[room]
+            if not any(other['channel'] == entry['channel'] for other in self._rooms.values()):
+                # Nobody is watching; forget dynamic channels and their data
+                if entry['channel'] not in self.pinned:
+                    self._last_data.pop(entry['channel'], None)
+                    channel = self._channels.pop(entry['channel'], None)
+                    if channel is not None and channel.close:
+                        channel.close()
+    
+    def _notify(self):
+        """Wake the scheduler after subscriptions changed; safe from any thread"""
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._changed.set)
+            except RuntimeError:
+                # The loop has shut down
+                pass
+    
+    def _period(self, name):
+        """Seconds between ticks of a channel, or None when nothing needs it"""
+        with self._lock:
+            intervals = [entry['interval'] for entry in self._rooms.values() if entry['channel'] == name]
+            if name in self.pinned:
+                intervals.append(self.pinned[name])
+            return min(intervals) if intervals else None
+    
+    def _waiting(self, name):
+        """Whether a room of the channel has had no data yet"""
+        with self._lock:
+            return any(
+                entry['channel'] == name and not entry['next_due']
+                for entry in self._rooms.values()
+            )
+    
+    def _due_rooms(self, name, scheduled, period):
+        """Rooms of a channel that get the collection of the tick at scheduled"""
+        rooms = set()
+        with self._lock:
+            for room, entry in self._rooms.items():
+                # Within half a tick counts as due, so rooms at the
+                # channel's own rate never miss one to float rounding
+                if entry['channel'] == name and entry['next_due'] - scheduled < period / 2:
+                    rooms.add(room)
+                    entry['next_due'] = scheduled + entry['interval']
+        return rooms
+    
+    def _run(self):
+        asyncio.run(self._supervise())
+    
+    async def _supervise(self):
+        """Start a task for every channel that became active"""
+        self._changed = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        while True:
+            self._changed.clear()
+            with self._lock:
+                active = {entry['channel'] for entry in self._rooms.values()} | set(self.pinned)
+            for name in active:
+                task = self._tasks.get(name)
+                if task is None or task[0].done():
+                    wake = asyncio.Event()
+                    self._tasks[name] = (asyncio.create_task(self._schedule(name, wake)), wake)
+                else:
+                    task[1].set()
+            # Channels that went idle end their own tasks once woken
+            for name, (task, wake) in list(self._tasks.items()):
+                if task.done():
+                    del self._tasks[name]
+                elif name not in active:
+                    wake.set()
+            await self._changed.wait()
+    
+    async def _schedule(self, name, wake):
+        """Collect one channel on fixed ticks until nobody needs it
+        
+        Ticks are anchor + k * period, so collection time never shifts the
+        schedule. A collection still running at its next tick makes that
+        tick an overrun: it is skipped rather than started late.
+        """
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        broadcaster = asyncio.create_task(self._broadcast(name, ready))
+        period = None
+        next_tick = None
+        try:
+            while True:
+                current = self._period(name)
+                if current is None:
+                    return
+                now = loop.time()
+                if current != period:
+                    # Spread channels over their period instead of all
+                    # collecting on the same instant
+                    period = current
+                    first = now + random.uniform(0, self.jitter * period)
+                    next_tick = first if next_tick is None else min(next_tick, first)
+                
+                # New subscribers get data right away, off the grid
+                waiting = self._waiting(name)
+                if now < next_tick and not waiting:
+                    wake.clear()
+                    try:
+                        await asyncio.wait_for(wake.wait(), next_tick - now)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                
+                if now >= next_tick:
+                    CHANNEL_LAG.observe(now - next_tick, channel=_kind(name))
+                    scheduled = next_tick
+                    next_tick += period
+                else:
+                    scheduled = now
+                rooms = self._due_rooms(name, scheduled, period)
+                
+                data = await self._collect(name, period)
+                if data is not None:
+                    self._publish(name, data, rooms, ready)
+                
+                now = loop.time()
+                if now >= next_tick:
+                    missed = int((now - next_tick) // period) + 1
+                    CHANNEL_OVERRUNS.inc(missed, channel=_kind(name))
+                    next_tick += missed * period
+        finally:
+            broadcaster.cancel()
+            self._pending.pop(name, None)
+    
+    async def _collect(self, name, period):
+        """Run a channel's collector in the pool; None if it failed"""
+        with self._lock:
+            channel = self._channels.get(name)
+            if channel is None and name in self.pinned:
+                channel = self._channels[name] = self.resolve(name)
+        # A channel forgotten since this tick started isn't resolved again,
+        # or whatever it opens would never be closed
+        if channel is None:
+            return None
+        
+        deadline = channel.deadline or self.deadline_periods * period
+        future = asyncio.get_running_loop().run_in_executor(self._collect_executor, self._timed_collect, channel)
+        try:
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), deadline)
+            except asyncio.TimeoutError:
+                CHANNEL_DEADLINE_MISSES.inc(channel=_kind(name))
+                print(f"Channel {name} missed its {deadline:g}s deadline")
+                # A thread can't be interrupted; wait it out rather than
+                # stacking more calls on a stuck daemon, and publish what
+                # it returns. The ticks this costs are counted as overruns
+                return await future
+        except Exception as e:
+            print(f"Error collecting channel {name}: {e}")
+        return None
+    
+    def _timed_collect(self, channel):
+        with metrics.timed(CHANNEL_SECONDS, COLLECTOR_ERRORS, detail=channel.name, channel=_kind(channel.name)):
+            return channel.collect()
+    
+    def _publish(self, name, data, rooms, ready):
+        """Hand a collection to the channel's broadcaster, newest wins"""
+        pending = self._pending.get(name)
+        if pending is not None:
+            # The previous update hasn't gone out yet; its rooms get this one
+            CHANNEL_COALESCED.inc(channel=_kind(name))
+            rooms = rooms | pending[1]
+        self._pending[name] = (data, rooms)
+        ready.set()
+    
+    async def _broadcast(self, name, ready):
+        """Emit a channel's updates one at a time, off the event loop"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await ready.wait()
+            ready.clear()
+            data, rooms = self._pending.pop(name)
+            try:
+                await loop.run_in_executor(self._emit_executor, self._emit, name, data, rooms)
+            except Exception as e:
+                print(f"Error broadcasting channel {name}: {e}")
+    
+    def _emit(self, name, data, rooms):
+        with self._lock:
+            self._last_data[name] = data
+            patches = [
+                (room, self._rooms[room]['encoder'].update(data))
+                for room in rooms
+                if room in self._rooms
+            ]
+        
+        # Encoders are per process, so patches go straight to this
+        # process's clients and never through a message queue
+        for room, delta in patches:
+            if delta:
+                delta['channel'] = name
+                self.socketio.emit('delta', delta, to=room, ignore_queue=True)
+                EMITS.inc(event='delta')
\ No newline at end of file
@@ -0,0 +1,240 @@
+import os
+import threading
+import time
+from utils.instrumentation import COLLECTOR_ERRORS
+
+# Log lines a container's detail view starts with and keeps
+CONTAINER_LOG_LINES = int(os.environ.get('CONTAINER_LOG_LINES', 100))
+# Longer lines are cut so one noisy container can't bloat every update
+LOG_LINE_MAX = 2000
+
+# memory_stats.stats names under cgroup v1, then their cgroup v2 equivalents
+MEMORY_KEYS = {
+    'rss': ('rss', 'anon'),
+    'cache': ('cache', 'file'),
+    'mapped_file': ('mapped_file', 'file_mapped'),
+    'inactive_file': ('total_inactive_file', 'inactive_file'),
+    'shmem': ('shmem',),
+    'slab': ('slab',),
+    'swap': ('swap',)
+}
+
+NETWORK_KEYS = ('rx_bytes', 'tx_bytes', 'rx_packets', 'tx_packets', 'rx_errors', 'tx_errors', 'rx_dropped', 'tx_dropped')
+
+def cpu_detail(stats):
+    """Total and per-CPU usage, in percent of one CPU, from a stats sample"""
+    cpu = stats.get('cpu_stats') or {}
+    precpu = stats.get('precpu_stats') or {}
+    percpu = (cpu.get('cpu_usage') or {}).get('percpu_usage') or []
+    prepercpu = (precpu.get('cpu_usage') or {}).get('percpu_usage') or []
+    online = cpu.get('online_cpus') or len(percpu) or 1
+    
+    system_delta = cpu.get('system_cpu_usage', 0) - precpu.get('system_cpu_usage', 0)
+    if not precpu.get('system_cpu_usage') or system_delta <= 0:
+        # The first sample of a stream has nothing to compare against
+        return {'percent': 0.0, 'online_cpus': online, 'per_cpu': None}
+    
+    scale = online * 100 / system_delta
+    total_delta = (cpu.get('cpu_usage') or {}).get('total_usage', 0) - (precpu.get('cpu_usage') or {}).get('total_usage', 0)
+    per_cpu = None
+    # cgroup v2 doesn't report per-CPU usage
+    if percpu and len(percpu) == len(prepercpu):
+        per_cpu = [round(max(0, now - before) * scale, 1) for now, before in zip(percpu, prepercpu)]
+    return {'percent': round(max(0, total_delta) * scale, 1), 'online_cpus': online, 'per_cpu': per_cpu}
+
+def memory_detail(stats):
+    """Usage, limit and the cache/rss breakdown from memory_stats.stats"""
+    memory = stats.get('memory_stats') or {}
+    usage = memory.get('usage', 0)
+    limit = memory.get('limit', 0)
+    raw = memory.get('stats') or {}
+    
+    detail = {'usage': usage, 'limit': limit}
+    for name, keys in MEMORY_KEYS.items():
+        value = next((raw[key] for key in keys if key in raw), None)
+        if value is not None:
+            detail[name] = value
+    # Like `docker stats`: inactive page cache can be reclaimed, so it doesn't count
+    detail['working_set'] = max(0, usage - detail.get('inactive_file', 0))
+    detail['percent'] = round(detail['working_set'] / limit * 100, 1) if limit else 0
+    return detail
+
+def block_io_totals(stats):
+    """Bytes and operations read and written, per 'major:minor' device"""
+    blkio = stats.get('blkio_stats') or {}
+    devices = {}
+    for field, unit in (('io_service_bytes_recursive', 'bytes'), ('io_serviced_recursive', 'ops')):
+        # cgroup v1 says 'Read', v2 'read'; v2 has no serviced counts
+        for item in blkio.get(field) or []:
+            op = (item.get('op') or '').lower()
+            if op not in ('read', 'write'):
+                continue
+            device = devices.setdefault(f"{item.get('major')}:{item.get('minor')}", {})
+            key = f"{op}_{unit}"
+            device[key] = device.get(key, 0) + item.get('value', 0)
+    return devices
+
+def network_totals(stats):
+    """Counters per network interface"""
+    return {
+        name: {key: counters.get(key, 0) for key in NETWORK_KEYS}
+        for name, counters in (stats.get('networks') or {}).items()
+    }
+
+def with_rates(current, previous, seconds):
+    """Counters per device or interface, each with its per-second rate since previous"""
+    result = {}
+    for name, counters in current.items():
+        before = (previous or {}).get(name)
+        entry = dict(counters)
+        for key, value in counters.items():
+            if before is not None and key in before and seconds:
+                entry[f"{key}_per_sec"] = round(max(0, value - before[key]) / seconds, 1)
+            else:
+                entry[f"{key}_per_sec"] = None
+        result[name] = entry
+    return result
+
+def sample_detail(stats, previous=None, seconds=None):
+    """(breakdown, counter totals) of one stats sample; rates come from the previous totals"""
+    block_io = block_io_totals(stats)
+    networks = network_totals(stats)
+    return {
+        'read': stats.get('read'),
+        'cpu': cpu_detail(stats),
+        'memory': memory_detail(stats),
+        'pids': (stats.get('pids_stats') or {}).get('current'),
+        'block_io': with_rates(block_io, previous and previous['block_io'], seconds),
+        'networks': with_rates(networks, previous and previous['networks'], seconds)
+    }, {'block_io': block_io, 'networks': networks}
+
+def decode_log_line(line):
+    return line.decode('utf-8', 'replace').rstrip('\r')[:LOG_LINE_MAX]
+
+class ContainerSampler:
+    """Stream one container's stats and logs while someone is watching it
+    
+    Docker's stats stream delivers a sample about every second and a
+    followed log stream delivers lines as they are written; stop() closes
+    both. Log lines are keyed by a running sequence number, so the delta
+    of the 'logs' dict between two updates is just the new lines.
+    """
+    
+    def __init__(self, container, log_lines=None, on_stop=None):
+        self.container = container
+        self.log_lines = log_lines or CONTAINER_LOG_LINES
+        self.on_stop = on_stop
+        
+        self._stats = None
+        self._detail = None
+        self._error = None
+        self._logs = {}
+        self._log_seq = 0
+        self._log_stream = None
+        self._started = False
+        self._stopped = False
+        self._lock = threading.Lock()
+    
+    def start(self):
+        """Open the stats and log streams; later calls do nothing"""
+        with self._lock:
+            if self._started or self._stopped:
+                return
+            self._started = True
+        
+        name = self.container.name
+        threading.Thread(target=self._read_stats, name=f"detail-stats-{name}", daemon=True).start()
+        threading.Thread(target=self._read_logs, name=f"detail-logs-{name}", daemon=True).start()
+    
+    def stop(self):
+        """Close both streams; the stats reader exits on its next sample"""
+        with self._lock:
+            self._stopped = True
+            stream = self._log_stream
+        if stream is not None:
+            try:
+                # Unblocks the reader even if the container logs nothing
+                stream.close()
+            except Exception:
+                pass
+        if self.on_stop:
+            self.on_stop(self)
+    
+    def latest(self):
+        """(raw stats, detail) of the newest sample, or (None, None) before the first"""
+        with self._lock:
+            return self._stats, self._detail
+    
+    def collect(self):
+        """Latest breakdown and log tail; the first call starts sampling"""
+        self.start()
+        with self._lock:
+            state = {
+                'id': self.container.id[:12],
+                'name': self.container.name,
+                'logs': dict(self._logs)
+            }
+            if self._detail is None:
+                state['partial'] = True
+            else:
+                state.update(self._detail)
+            if self._error:
+                state['error'] = self._error
+        return state
+    
+    def _read_stats(self):
+        previous = None
+        previous_at = None
+        try:
+            for stats in self.container.stats(stream=True, decode=True):
+                if self._stopped:
+                    return
+                now = time.monotonic()
+                detail, previous = sample_detail(stats, previous, now - previous_at if previous_at else None)
+                previous_at = now
+                with self._lock:
+                    self._stats = stats
+                    self._detail = detail
+        except Exception as e:
+            if self._stopped:
+                return
+            COLLECTOR_ERRORS.inc(phase='docker_detail')
+            print(f"Detail stats stream for {self.container.name} ended: {e}")
+        with self._lock:
+            if not self._stopped:
+                # Usually the container stopped
+                self._error = 'Stats stream ended'
+    
+    def _read_logs(self):
+        try:
+            stream = self.container.logs(stream=True, follow=True, tail=self.log_lines, timestamps=True)
+            with self._lock:
+                self._log_stream = stream
+                stopped = self._stopped
+            if stopped:
+                stream.close()
+                return
+            
+            pending = b''
+            for chunk in stream:
+                # Chunks are frames, not lines; keep any partial line for the next one
+                pending += chunk
+                *lines, pending = pending.split(b'\n')
+                if len(pending) > LOG_LINE_MAX:
+                    lines.append(pending)
+                    pending = b''
+                if lines:
+                    self._add_log_lines(lines)
+        except Exception as e:
+            if not self._stopped:
+                COLLECTOR_ERRORS.inc(phase='docker_detail')
+                print(f"Log stream for {self.container.name} ended: {e}")
+    
+    def _add_log_lines(self, lines):
+        with self._lock:
+            for line in lines:
+                self._log_seq += 1
+                self._logs[str(self._log_seq)] = decode_log_line(line)
+            # Dicts keep insertion order, so the first keys are the oldest lines
+            while len(self._logs) > self.log_lines:
+                del self._logs[next(iter(self._logs))]
\ No newline at end of file
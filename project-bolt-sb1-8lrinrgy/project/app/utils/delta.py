@@ -0,0 +1,57 @@
+import copy
+import threading
+
+def diff(old, new, path=()):
+    """List the set/del operations that turn old into new
+    
+    Dicts are compared key by key; any other value (including lists) is
+    replaced as a whole when it changes.
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key, value in new.items():
+            if key not in old:
+                ops.append(['set', [*path, key], value])
+            else:
+                ops.extend(diff(old[key], value, (*path, key)))
+        for key in old:
+            if key not in new:
+                ops.append(['del', [*path, key]])
+        return ops
+    
+    if old != new:
+        return [['set', list(path), new]]
+    return []
+
+class DeltaEncoder:
+    """Track the last broadcast state and produce sequenced patches against it"""
+    
+    def __init__(self):
+        self.seq = 0
+        self._state = None
+        self._lock = threading.Lock()
+    
+    def update(self, state):
+        """Replace the current state; returns the patch for clients, or None"""
+        with self._lock:
+            previous = self._state or {}
+            self._state = copy.deepcopy(state)
+            
+            ops = diff(previous, self._state)
+            if not ops:
+                return None
+            
+            self.seq += 1
+            return {
+                'seq': self.seq,
+                'base_seq': self.seq - 1,
+                'ops': ops
+            }
+    
+    def snapshot(self):
+        """Full state for a client that is (re)starting from scratch"""
+        with self._lock:
+            return {
+                'seq': self.seq,
+                'state': self._state or {}
+            }
\ No newline at end of file
@@ -1,17 +1,54 @@
 import docker
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
 import json
+from utils.container_detail import ContainerSampler, CONTAINER_LOG_LINES, decode_log_line, sample_detail
+from utils.instrumentation import metrics, COLLECTOR_SECONDS, COLLECTOR_ERRORS
 
 class DockerMonitor:
     """Monitor Docker containers and services"""
     
-    def __init__(self):
+    START_EVENTS = ('start',)
+    STOP_EVENTS = ('die', 'stop', 'destroy')
+    
+    def __init__(self, max_workers=None, stats_timeout=None, mode=None, resync_interval=None):
+        # 'poll' asks the daemon for stats on every refresh, 'stream' keeps
+        # one long-lived stats stream per container and reads the latest sample
+        self.mode = mode or os.environ.get('DOCKER_MONITOR_MODE', 'poll')
+        
+        # Stats fetches run on a bounded pool so a refresh takes roughly as
+        # long as the slowest container instead of the sum of all of them
+        self.max_workers = max_workers or int(os.environ.get('DOCKER_STATS_WORKERS', 8))
+        self.stats_timeout = stats_timeout or float(os.environ.get('DOCKER_STATS_TIMEOUT', 5))
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix='docker-stats'
+        )
+        
+        # The inventory is kept current from the events stream; a full
+        # re-list every resync_interval seconds catches anything missed
+        self.resync_interval = resync_interval or float(os.environ.get('DOCKER_INVENTORY_RESYNC', 300))
+        self._inventory = {}
+        self._inventory_lock = threading.Lock()
+        self._last_sync = 0
+        self._events = None
+        self._closed = False
+        # Containers someone is watching in detail, by full id
+        self._samplers = {}
+        
         try:
             self.client = docker.from_env()
             self.docker_available = True
         except Exception as e:
             print(f"Docker not available: {e}")
             self.docker_available = False
+        
+        if self.docker_available:
+            self.sync_inventory()
+            threading.Thread(target=self._follow_events, name='docker-events', daemon=True).start()
     
     def get_running_containers(self):
         """Get list of running Docker containers"""
@@ -19,57 +56,388 @@ class DockerMonitor:
             return []
         
         try:
-            containers = self.client.containers.list()
-            container_info = []
+            if time.monotonic() - self._last_sync > self.resync_interval:
+                self.sync_inventory()
+            
+            with self._inventory_lock:
+                entries = list(self._inventory.values())
+            
+            if self.mode == 'stream':
+                return self._get_streamed_containers(entries)
             
-            for container in containers:
+            # Fetch stats for all containers in parallel; each call blocks
+            # while the daemon takes its two CPU samples. A call that timed
+            # out can't be stopped and still holds a worker, so its
+            # container is skipped until it returns rather than piling
+            # more calls onto a slow daemon
+            futures = []
+            for entry in entries:
+                future, started = self._submit_stats(entry)
+                futures.append((entry, future if started else None))
+            
+            # Containers queued behind a full pool get their own timeout window
+            waves = -(-sum(future is not None for _, future in futures) // self.max_workers) or 1
+            deadline = time.monotonic() + self.stats_timeout * waves
+            
+            container_info = []
+            for entry, future in futures:
+                if future is None:
+                    COLLECTOR_ERRORS.inc(phase='docker_stats_busy')
+                    info = dict(entry['info'])
+                    info['partial'] = True
+                    info['error'] = 'Previous stats call still running'
+                    container_info.append(info)
+                    continue
                 try:
-                    # Get container stats
-                    stats = container.stats(stream=False)
-                    
-                    # Calculate CPU usage
-                    cpu_percent = self._calculate_cpu_percent(stats)
-                    
-                    # Calculate memory usage
-                    memory_usage = stats['memory_stats'].get('usage', 0)
-                    memory_limit = stats['memory_stats'].get('limit', 0)
-                    memory_percent = (memory_usage / memory_limit * 100) if memory_limit > 0 else 0
-                    
-                    # Get container creation time
-                    created = datetime.fromisoformat(container.attrs['Created'].replace('Z', '+00:00'))
-                    uptime = datetime.now() - created.replace(tzinfo=None)
-                    
-                    container_info.append({
-                        'id': container.id[:12],
-                        'name': container.name,
-                        'image': container.image.tags[0] if container.image.tags else 'unknown',
-                        'status': container.status,
-                        'state': container.attrs['State']['Status'],
-                        'created': created.isoformat(),
-                        'uptime_seconds': int(uptime.total_seconds()),
-                        'ports': self._format_ports(container.ports),
-                        'cpu_percent': round(cpu_percent, 1),
-                        'memory_percent': round(memory_percent, 1),
-                        'memory_usage': memory_usage,
-                        'network_rx': self._get_network_stat(stats, 'rx_bytes'),
-                        'network_tx': self._get_network_stat(stats, 'tx_bytes')
-                    })
+                    stats = future.result(timeout=max(0, deadline - time.monotonic()))
+                    container_info.append(self._build_container_info(entry, stats))
+                except FutureTimeoutError:
+                    future.cancel()
+                    COLLECTOR_ERRORS.inc(phase='docker_stats_timeout')
+                    info = dict(entry['info'])
+                    info['partial'] = True
+                    info['error'] = 'Stats timed out'
+                    container_info.append(info)
                 except Exception as e:
                     # If we can't get stats, just add basic info
-                    container_info.append({
-                        'id': container.id[:12],
-                        'name': container.name,
-                        'image': container.image.tags[0] if container.image.tags else 'unknown',
-                        'status': container.status,
-                        'state': container.attrs['State']['Status'],
-                        'error': str(e)
-                    })
+                    info = dict(entry['info'])
+                    info['error'] = str(e)
+                    container_info.append(info)
             
             return container_info
         except Exception as e:
             print(f"Error getting containers: {e}")
             return []
     
+    def get_container(self, container_id):
+        """Get info for a single running container by (short) id"""
+        entry = self._find(container_id)
+        if entry is None:
+            return None
+        
+        try:
+            if self.mode == 'stream':
+                stats = entry['stats']
+            else:
+                future, _ = self._submit_stats(entry)
+                stats = future.result(timeout=self.stats_timeout)
+            if stats is None:
+                info = dict(entry['info'])
+                info['partial'] = True
+                return info
+            return self._build_container_info(entry, stats)
+        except FutureTimeoutError:
+            info = dict(entry['info'])
+            info['partial'] = True
+            info['error'] = 'Stats timed out'
+            return info
+        except Exception as e:
+            info = dict(entry['info'])
+            info['error'] = str(e)
+            return info
+    
+    def get_container_detail(self, container_id, log_lines=None):
+        """Summary, configuration, resource breakdown and recent logs of one container"""
+        entry = self._find(container_id)
+        if entry is None:
+            return None
+        container = entry['container']
+        
+        # While the detail channel samples this container, reuse its
+        # latest sample (which has rates) instead of asking the daemon
+        with self._inventory_lock:
+            sampler = self._samplers.get(container.id)
+        stats, detail = sampler.latest() if sampler else (None, None)
+        
+        info = dict(entry['info'])
+        try:
+            if stats is None:
+                future, _ = self._submit_stats(entry)
+                stats = future.result(timeout=self.stats_timeout)
+                detail, _ = sample_detail(stats)
+            info = self._build_container_info(entry, stats)
+            info.update(detail)
+        except FutureTimeoutError:
+            info['partial'] = True
+            info['error'] = 'Stats timed out'
+        except Exception as e:
+            info['error'] = str(e)
+        
+        info['live'] = sampler is not None
+        info['config'] = self._container_config(container)
+        try:
+            with metrics.timed(COLLECTOR_SECONDS, COLLECTOR_ERRORS, detail=info['name'], phase='docker_logs'):
+                logs = container.logs(tail=log_lines or CONTAINER_LOG_LINES, timestamps=True)
+            info['logs'] = [decode_log_line(line) for line in logs.splitlines()]
+        except Exception as e:
+            info['logs'] = []
+            info['logs_error'] = str(e)
+        return info
+    
+    def watch(self, container_id):
+        """A sampler streaming one container's stats and logs, or None if it isn't running"""
+        entry = self._find(container_id)
+        if entry is None:
+            return None
+        sampler = ContainerSampler(entry['container'], on_stop=self._unwatch)
+        with self._inventory_lock:
+            self._samplers[entry['container'].id] = sampler
+        return sampler
+    
+    def _unwatch(self, sampler):
+        with self._inventory_lock:
+            if self._samplers.get(sampler.container.id) is sampler:
+                del self._samplers[sampler.container.id]
+    
+    def _find(self, container_id):
+        """Inventory entry of a running container by (short) id"""
+        if not self.docker_available:
+            return None
+        with self._inventory_lock:
+            return next(
+                (entry for full_id, entry in self._inventory.items() if full_id.startswith(container_id)),
+                None
+            )
+    
+    def _container_config(self, container):
+        """Settings worth showing from a container's inspect data"""
+        attrs = container.attrs
+        config = attrs.get('Config') or {}
+        host_config = attrs.get('HostConfig') or {}
+        networks = (attrs.get('NetworkSettings') or {}).get('Networks') or {}
+        return {
+            'command': ' '.join(config.get('Cmd') or []),
+            'entrypoint': ' '.join(config.get('Entrypoint') or []),
+            'restart_policy': (host_config.get('RestartPolicy') or {}).get('Name'),
+            'health': ((attrs.get('State') or {}).get('Health') or {}).get('Status'),
+            'mounts': [
+                {
+                    'source': mount.get('Source'),
+                    'destination': mount.get('Destination'),
+                    'read_only': not mount.get('RW', True)
+                }
+                for mount in attrs.get('Mounts') or []
+            ],
+            'networks': {name: network.get('IPAddress') for name, network in networks.items()}
+        }
+    
+    def _submit_stats(self, entry):
+        """(future, started) of a one-shot stats call; reuses one still running"""
+        with self._inventory_lock:
+            future = entry.get('fetch')
+            if future is not None and not future.done():
+                return future, False
+            future = entry['fetch'] = self._executor.submit(self._fetch_stats, entry)
+            return future, True
+    
+    def _fetch_stats(self, entry):
+        """One-shot stats call for a container"""
+        with metrics.timed(COLLECTOR_SECONDS, COLLECTOR_ERRORS, detail=entry['info']['name'], phase='docker_stats'):
+            return entry['container'].stats(stream=False)
+    
+    def sync_inventory(self):
+        """Rebuild the container inventory from one full list"""
+        try:
+            with metrics.timed(COLLECTOR_SECONDS, COLLECTOR_ERRORS, phase='docker_list'):
+                containers = self.client.containers.list()
+        except Exception as e:
+            print(f"Error syncing container inventory: {e}")
+            return
+        
+        running_ids = {container.id for container in containers}
+        with self._inventory_lock:
+            stale_ids = [cid for cid in self._inventory if cid not in running_ids]
+            known_ids = set(self._inventory)
+        
+        for container_id in stale_ids:
+            self._remove_container(container_id)
+        for container in containers:
+            if container.id not in known_ids:
+                self._add_container(container)
+        
+        self._last_sync = time.monotonic()
+    
+    def close(self):
+        """Stop following events and drop the inventory"""
+        self._closed = True
+        if self._events is not None:
+            self._events.close()
+        with self._inventory_lock:
+            self._inventory.clear()
+    
+    def _add_container(self, container):
+        """Cache a container's static metadata and start streaming if enabled"""
+        try:
+            created = datetime.fromisoformat(container.attrs['Created'].replace('Z', '+00:00'))
+            entry = {
+                'container': container,
+                'info': self._basic_container_info(container),
+                'created': created.replace(tzinfo=None),
+                'created_iso': created.isoformat(),
+                'ports': self._format_ports(container.ports),
+                'stats': None
+            }
+        except Exception as e:
+            print(f"Error caching container {container.id[:12]}: {e}")
+            return
+        
+        with self._inventory_lock:
+            if container.id in self._inventory:
+                return
+            self._inventory[container.id] = entry
+        
+        if self.mode == 'stream':
+            threading.Thread(
+                target=self._read_stream,
+                args=(entry,),
+                name=f"docker-stats-{container.name}",
+                daemon=True
+            ).start()
+    
+    def _remove_container(self, container_id):
+        """Forget a container; its stats reader exits on the next sample or retry"""
+        with self._inventory_lock:
+            self._inventory.pop(container_id, None)
+    
+    def _get_streamed_containers(self, entries):
+        """Build container info from the latest streamed samples"""
+        container_info = []
+        for entry in entries:
+            stats = entry['stats']
+            if stats is None:
+                # Stream opened but the first sample hasn't arrived yet
+                info = dict(entry['info'])
+                info['partial'] = True
+                container_info.append(info)
+                continue
+            try:
+                container_info.append(self._build_container_info(entry, stats))
+            except Exception as e:
+                info = dict(entry['info'])
+                info['error'] = str(e)
+                container_info.append(info)
+        return container_info
+    
+    def _read_stream(self, entry):
+        """Keep the latest decoded sample of a container's stats stream
+        
+        A stream that breaks (a daemon hiccup, a read timeout) is reopened
+        with backoff. The entry only leaves the inventory on a die/destroy
+        event, or when a resync no longer lists the container.
+        """
+        container = entry['container']
+        backoff = 1
+        while self._is_current(entry):
+            try:
+                for stats in container.stats(stream=True, decode=True):
+                    with self._inventory_lock:
+                        if self._inventory.get(container.id) is not entry:
+                            return
+                        entry['stats'] = stats
+                    backoff = 1
+            except docker.errors.NotFound:
+                # Removed while the event was missed
+                with self._inventory_lock:
+                    if self._inventory.get(container.id) is entry:
+                        del self._inventory[container.id]
+                return
+            except Exception as e:
+                if self._closed:
+                    return
+                COLLECTOR_ERRORS.inc(phase='docker_stream')
+                print(f"Stats stream for {container.name} broke, reopening in {backoff}s: {e}")
+            # The last sample goes stale while reconnecting; until a new one
+            # arrives the container is reported as partial
+            with self._inventory_lock:
+                entry['stats'] = None
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+    
+    def _is_current(self, entry):
+        """Whether entry is still the inventory's entry for its container"""
+        with self._inventory_lock:
+            return not self._closed and self._inventory.get(entry['container'].id) is entry
+    
+    def _follow_events(self):
+        """Keep the inventory current from the Docker events stream"""
+        while not self._closed:
+            try:
+                self._events = self.client.events(decode=True, filters={'type': 'container'})
+                for event in self._events:
+                    self._handle_event(event)
+            except Exception as e:
+                if self._closed:
+                    break
+                print(f"Docker events stream error: {e}")
+            time.sleep(1)
+            # Events may have been missed while reconnecting
+            self.sync_inventory()
+    
+    def _handle_event(self, event):
+        """Apply a single container event to the inventory"""
+        action = event.get('Action') or event.get('status', '')
+        actor = event.get('Actor', {})
+        container_id = actor.get('ID') or event.get('id')
+        if not container_id:
+            return
+        
+        if action in self.START_EVENTS:
+            try:
+                self._add_container(self.client.containers.get(container_id))
+            except Exception as e:
+                print(f"Error adding container {container_id[:12]}: {e}")
+        elif action in self.STOP_EVENTS:
+            self._remove_container(container_id)
+        elif action in ('pause', 'unpause', 'rename'):
+            with self._inventory_lock:
+                entry = self._inventory.get(container_id)
+                if entry is None:
+                    return
+                info = dict(entry['info'])
+                if action == 'rename':
+                    info['name'] = actor.get('Attributes', {}).get('name', info['name'])
+                else:
+                    info['status'] = info['state'] = 'paused' if action == 'pause' else 'running'
+                entry['info'] = info
+    
+    def _basic_container_info(self, container):
+        """Build container info that doesn't require stats"""
+        return {
+            'id': container.id[:12],
+            'name': container.name,
+            'image': container.image.tags[0] if container.image.tags else 'unknown',
+            'status': container.status,
+            'state': container.attrs['State']['Status'],
+            # Refreshed when the container starts again, so restarts show up here
+            'started_at': container.attrs['State'].get('StartedAt'),
+            'restart_count': container.attrs.get('RestartCount', 0)
+        }
+    
+    def _build_container_info(self, entry, stats):
+        """Build full container info from a stats sample"""
+        # Calculate CPU usage
+        cpu_percent = self._calculate_cpu_percent(stats)
+        
+        # Calculate memory usage
+        memory_usage = stats['memory_stats'].get('usage', 0)
+        memory_limit = stats['memory_stats'].get('limit', 0)
+        memory_percent = (memory_usage / memory_limit * 100) if memory_limit > 0 else 0
+        
+        uptime = datetime.now() - entry['created']
+        
+        info = dict(entry['info'])
+        info.update({
+            'created': entry['created_iso'],
+            'uptime_seconds': int(uptime.total_seconds()),
+            'ports': entry['ports'],
+            'cpu_percent': round(cpu_percent, 1),
+            'memory_percent': round(memory_percent, 1),
+            'memory_usage': memory_usage,
+            'network_rx': self._get_network_stat(stats, 'rx_bytes'),
+            'network_tx': self._get_network_stat(stats, 'tx_bytes')
+        })
+        return info
+    
     def _calculate_cpu_percent(self, stats):
         """Calculate CPU usage percentage"""
         try:
@@ -0,0 +1,69 @@
+import csv
+import io
+import json
+import os
+import sqlite3
+import zlib
+
+# Rows formatted per yielded chunk; memory stays at one chunk whatever the table size
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', 5000))
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+def iter_query(db_path, query, params=(), chunk_rows=None):
+    """Yield lists of rows from a query on a connection of its own
+    
+    The cursor steps through the result as it is read, so only one chunk
+    of rows is in memory at a time. The connection holds one read
+    transaction for the whole export, giving a consistent snapshot; under
+    WAL that doesn't block writers.
+    """
+    conn = sqlite3.connect(db_path, timeout=10)
+    try:
+        cursor = conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_rows or EXPORT_CHUNK_ROWS)
+            if not rows:
+                break
+            yield rows
+    finally:
+        # Also runs when the client disconnects and the generator is closed
+        conn.close()
+
+def encode_csv(columns, chunks):
+    """Encode row chunks as CSV with a header line"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+def encode_ndjson(columns, chunks):
+    """Encode row chunks as one JSON object per line"""
+    for rows in chunks:
+        yield ''.join(
+            json.dumps(dict(zip(columns, row)), separators=(',', ':')) + '\n'
+            for row in rows
+        ).encode()
+
+def gzip_stream(chunks, level=6):
+    """Compress a stream of byte chunks into one gzip member as it goes"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_stream(columns, chunks, fmt='csv', compress=False):
+    """Byte chunks of an export in fmt ('csv' or 'ndjson'), optionally gzipped"""
+    encoded = encode_csv(columns, chunks) if fmt == 'csv' else encode_ndjson(columns, chunks)
+    return gzip_stream(encoded) if compress else encoded
\ No newline at end of file
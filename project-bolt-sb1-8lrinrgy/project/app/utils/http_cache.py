@@ -0,0 +1,62 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from flask import Response, request
+
+class CachedPayload:
+    """A JSON body serialized once, with its ETag and an optional gzipped copy"""
+    
+    __slots__ = ('body', 'gzipped', 'etag')
+    
+    def __init__(self, data, compress_min=1024):
+        self.body = json.dumps(data, separators=(',', ':'), sort_keys=True, default=str).encode()
+        self.etag = hashlib.blake2b(self.body, digest_size=16).hexdigest()
+        # Small bodies aren't worth compressing (matches nginx's gzip_min_length)
+        self.gzipped = gzip.compress(self.body, compresslevel=6) if len(self.body) >= compress_min else None
+
+class ResponseCache:
+    """Serialized read endpoint payloads, rebuilt only when their source changes"""
+    
+    def __init__(self, compress_min=None):
+        self.compress_min = compress_min or int(os.environ.get('HTTP_CACHE_COMPRESS_MIN', 1024))
+        self._entries = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key, version, build=None):
+        """Get the payload for key, calling build() only when version changed
+        
+        version is usually the source object itself: collectors replace
+        their dicts every tick, so an identity check is enough and the
+        entry keeps the old object alive so its id can't be reused. Other
+        versions (e.g. a file's mtime) are compared by value.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and (entry[0] is version or entry[0] == version):
+            return entry[1]
+        
+        payload = CachedPayload(build() if build else version, self.compress_min)
+        with self._lock:
+            self._entries[key] = (version, payload)
+        return payload
+    
+    def response(self, payload, max_age=0):
+        """Build a response for a payload, honouring If-None-Match and Accept-Encoding"""
+        use_gzip = payload.gzipped is not None and 'gzip' in request.headers.get('Accept-Encoding', '')
+        # Each representation gets its own strong ETag
+        etag = f"{payload.etag}-gz" if use_gzip else payload.etag
+        
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = Response(payload.gzipped if use_gzip else payload.body, mimetype='application/json')
+            if use_gzip:
+                response.headers['Content-Encoding'] = 'gzip'
+        
+        response.set_etag(etag)
+        response.headers['Vary'] = 'Accept-Encoding'
+        # max_age 0: clients may store it but must revalidate (a cheap 304)
+        response.headers['Cache-Control'] = f"public, max-age={max_age}" if max_age else 'no-cache'
+        return response
\ No newline at end of file
@@ -0,0 +1,62 @@
+import hashlib
+import math
+
+# 2 ** -rank for every possible register value
+_POWERS = [2.0 ** -rank for rank in range(65)]
+
+class HyperLogLog:
+    """Mergeable distinct-count sketch in a fixed number of bytes
+    
+    With precision p the sketch is 2**p one-byte registers and the
+    estimate is within about 1.04 / sqrt(2**p) (1.6% at p=12). Sketches
+    of the same precision merge by taking the larger register, so the
+    unique count of any set of buckets comes from their stored sketches.
+    """
+    
+    def __init__(self, precision=12, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+        if len(self.registers) != self.size:
+            raise ValueError(f"Expected {self.size} registers, got {len(self.registers)}")
+    
+    @classmethod
+    def from_bytes(cls, data):
+        """Rebuild a sketch from to_bytes() output"""
+        return cls(int(math.log2(len(data))), data)
+    
+    def to_bytes(self):
+        return bytes(self.registers)
+    
+    def add(self, value):
+        """Add a string value"""
+        hashed = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+        index = hashed >> (64 - self.precision)
+        remaining = 64 - self.precision
+        # Position of the first 1 bit in what is left of the hash
+        rank = remaining - (hashed & ((1 << remaining) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+    
+    def update(self, *others):
+        """Merge other sketches of the same precision into this one"""
+        if any(other.size != self.size for other in others):
+            raise ValueError('Cannot merge sketches of different precision')
+        # One pass over all of them; merging pairwise costs a pass each
+        self.registers = bytearray(map(max, self.registers, *(other.registers for other in others)))
+    
+    def count(self):
+        """Estimated number of distinct values added"""
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        # Registers hold small ranks, so counting each rank beats summing every register
+        counts = []
+        remaining = self.size
+        while remaining:
+            counts.append(self.registers.count(len(counts)))
+            remaining -= counts[-1]
+        estimate = alpha * self.size * self.size / sum(count * _POWERS[rank] for rank, count in enumerate(counts))
+        zeros = counts[0]
+        # Linear counting is more accurate while many registers are empty
+        if estimate <= 2.5 * self.size and zeros:
+            estimate = self.size * math.log(self.size / zeros)
+        return int(round(estimate))
\ No newline at end of file
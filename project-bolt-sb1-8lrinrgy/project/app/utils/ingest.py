@@ -0,0 +1,130 @@
+import gzip
+import json
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_TYPE = 'application/msgpack'
+JSON_TYPE = 'application/json'
+
+class IngestError(Exception):
+    """A batch that can't be accepted; carries the HTTP status to answer with"""
+    
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def encode_batch(payload, use_msgpack=True):
+    """Serialize and gzip an agent batch; returns (body, content type)"""
+    if use_msgpack and msgpack is not None:
+        body, content_type = msgpack.packb(payload, default=str), MSGPACK_TYPE
+    else:
+        body, content_type = json.dumps(payload, default=str, separators=(',', ':')).encode(), JSON_TYPE
+    return gzip.compress(body, compresslevel=6), content_type
+
+def decode_batch(body, content_type, content_encoding=None, max_bytes=8 * 1024 * 1024):
+    """Decompress and parse an agent batch, refusing anything over max_bytes"""
+    if content_encoding == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(body, max_bytes)
+        except zlib.error as e:
+            raise IngestError(f"Invalid gzip body: {e}")
+        if decompressor.unconsumed_tail:
+            raise IngestError('Batch too large', 413)
+    elif len(body) > max_bytes:
+        raise IngestError('Batch too large', 413)
+    
+    content_type = (content_type or '').split(';')[0].strip()
+    try:
+        if content_type == MSGPACK_TYPE:
+            if msgpack is None:
+                raise IngestError('msgpack is not installed on this server', 415)
+            payload = msgpack.unpackb(body)
+        elif content_type == JSON_TYPE:
+            payload = json.loads(body)
+        else:
+            raise IngestError(f"Unsupported content type: {content_type}", 415)
+    except IngestError:
+        raise
+    except Exception as e:
+        raise IngestError(f"Invalid batch: {e}")
+    
+    if not isinstance(payload, dict) or not payload.get('host') or not isinstance(payload.get('samples'), list):
+        raise IngestError('Batch needs a host and a list of samples')
+    return payload
+
+def metric_name(host, metric):
+    """History series name of a metric reported by a remote host"""
+    return f"{host}/{metric}"
+
+class HostRegistry:
+    """Latest state and history for the hosts that push samples to this instance"""
+    
+    def __init__(self, history, store, offline_after=None):
+        self.history = history
+        self.store = store
+        self.offline_after = offline_after or float(os.environ.get('HOST_OFFLINE_AFTER', 60))
+        self._hosts = {}
+        self._lock = threading.Lock()
+    
+    def ingest(self, payload):
+        """Record an agent batch; returns the number of samples accepted"""
+        host = str(payload['host'])
+        accepted = 0
+        for sample in payload['samples']:
+            try:
+                ts = float(sample['ts'])
+                metrics = {
+                    metric_name(host, name): float(value)
+                    for name, value in sample['metrics'].items()
+                }
+            except (KeyError, TypeError, ValueError, AttributeError):
+                continue
+            self.history.record(metrics, ts)
+            self.store.record(metrics, ts)
+            accepted += 1
+        
+        with self._lock:
+            entry = self._hosts.setdefault(host, {'samples': 0, 'system': {}, 'services': []})
+            entry['samples'] += accepted
+            entry['last_seen'] = time.time()
+            # Only the newest snapshot is sent with each batch
+            if payload.get('system') is not None:
+                entry['system'] = payload['system']
+            if payload.get('services') is not None:
+                entry['services'] = [dict(service, host=host) for service in payload['services']]
+        return accepted
+    
+    def hosts(self):
+        """List known hosts with when they were last heard from"""
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    'host': host,
+                    'last_seen': datetime.fromtimestamp(entry['last_seen']).isoformat(),
+                    'online': now - entry['last_seen'] <= self.offline_after,
+                    'samples': entry['samples']
+                }
+                for host, entry in sorted(self._hosts.items())
+            ]
+    
+    def get(self, host):
+        """Latest {'system', 'services'} pushed by a host, or None"""
+        with self._lock:
+            entry = self._hosts.get(host)
+            if entry is None:
+                return None
+            return {
+                'host': host,
+                'system': entry['system'],
+                'services': entry['services']
+            }
\ No newline at end of file
@@ -0,0 +1,212 @@
+import bisect
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Seconds; spans sub-millisecond psutil reads up to slow Docker stats calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic count per label set"""
+    
+    kind = 'counter'
+    
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+class Gauge:
+    """Value read from a callback when metrics are rendered
+    
+    With a label name, the callback returns a dict of label value -> number.
+    """
+    
+    kind = 'gauge'
+    
+    def __init__(self, name, help, read, label=None):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.label = label
+    
+    def samples(self):
+        try:
+            value = self.read()
+        except Exception as e:
+            print(f"Error reading gauge {self.name}: {e}")
+            return []
+        if self.label:
+            return [(self.name, ((self.label, key),), count) for key, count in sorted(value.items())]
+        return [(self.name, (), value)]
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set"""
+    
+    kind = 'histogram'
+    
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+    
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    samples.append((f"{self.name}_bucket", key + (('le', le),), cumulative))
+                samples.append((f"{self.name}_sum", key, total))
+                samples.append((f"{self.name}_count", key, count))
+        return samples
+
+class Registry:
+    """Collector metrics plus a ring of recent timed operations"""
+    
+    def __init__(self, recent_size=None):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        # Every timed operation lands here; the slowest are picked on demand
+        self.recent = deque(maxlen=recent_size or int(os.environ.get('INSTRUMENTATION_RECENT_OPS', 2000)))
+    
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+    
+    def counter(self, name, help):
+        return self._register(Counter(name, help))
+    
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, buckets))
+    
+    def gauge(self, name, help, read, label=None):
+        """Register (or replace) a gauge read at render time"""
+        gauge = Gauge(name, help, read, label)
+        with self._lock:
+            self._metrics[name] = gauge
+        return gauge
+    
+    @contextmanager
+    def timed(self, histogram, errors=None, detail=None, **labels):
+        """Time a block into a histogram, counting exceptions in errors
+        
+        detail (e.g. a container name) only goes to the recent operations,
+        keeping histogram label cardinality low.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            if errors is not None:
+                errors.inc(**labels)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            histogram.observe(elapsed, **labels)
+            self.recent.append((elapsed, time.time(), histogram.name, labels, detail))
+    
+    def slowest(self, limit=20):
+        """Get the slowest of the recent timed operations"""
+        recent = list(self.recent)
+        recent.sort(key=lambda op: op[0], reverse=True)
+        return [
+            {
+                'operation': name,
+                'labels': labels,
+                'detail': detail,
+                'seconds': round(elapsed, 6),
+                'at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(at))
+            }
+            for elapsed, at, name, labels, detail in recent[:limit]
+        ]
+    
+    def render(self):
+        """Render every metric in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+# Shared by every collector in the process
+metrics = Registry()
+
+COLLECTOR_SECONDS = metrics.histogram(
+    'homelab_collector_phase_seconds',
+    'Duration of collector phases (Docker, psutil, SQLite, GeoIP)'
+)
+COLLECTOR_ERRORS = metrics.counter(
+    'homelab_collector_errors_total',
+    'Collector phases that failed'
+)
+CHANNEL_SECONDS = metrics.histogram(
+    'homelab_channel_collect_seconds',
+    'Duration of one channel collection'
+)
+CHANNEL_LAG = metrics.histogram(
+    'homelab_channel_lag_seconds',
+    'How late a channel collection started compared to its schedule'
+)
+CHANNEL_OVERRUNS = metrics.counter(
+    'homelab_channel_overruns_total',
+    'Channel ticks skipped because the previous collection was still running'
+)
+CHANNEL_DEADLINE_MISSES = metrics.counter(
+    'homelab_channel_deadline_misses_total',
+    'Channel collections that took longer than their deadline'
+)
+CHANNEL_COALESCED = metrics.counter(
+    'homelab_channel_coalesced_total',
+    'Channel updates replaced by a newer one before they were broadcast'
+)
+HISTORY_EVICTIONS = metrics.counter(
+    'homelab_history_evictions_total',
+    'New in-memory history series at the cap, by outcome (evicted an idle series, skipped)'
+)
+EMITS = metrics.counter(
+    'homelab_socketio_emits_total',
+    'Socket.IO events emitted'
+)
\ No newline at end of file
@@ -0,0 +1,48 @@
+import threading
+import time
+
+class Lazy:
+    """A resource built on first use, once, by whichever thread gets there first
+    
+    Attribute access goes to the built object, so call sites use it as if
+    it were the object itself. A factory that raises is retried on the
+    next use.
+    """
+    
+    def __init__(self, name, factory):
+        self._name = name
+        self._factory = factory
+        self._value = None
+        self._loaded = False
+        self._seconds = None
+        self._lock = threading.Lock()
+    
+    def load(self):
+        """Build the resource if that hasn't happened yet and return it"""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    started = time.perf_counter()
+                    self._value = self._factory()
+                    self._seconds = time.perf_counter() - started
+                    self._loaded = True
+        return self._value
+    
+    @property
+    def name(self):
+        return self._name
+    
+    @property
+    def loaded(self):
+        return self._loaded
+    
+    @property
+    def seconds(self):
+        """How long building the resource took, or None before it was built"""
+        return self._seconds
+    
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+    
+    def __repr__(self):
+        return f"<Lazy {self._name} {'loaded' if self._loaded else 'not loaded'}>"
\ No newline at end of file
@@ -0,0 +1,222 @@
+import os
+import re
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from utils.instrumentation import HISTORY_EVICTIONS
+
+# (step seconds, bucket count) per tier, finest first. Every sample is
+# written to all tiers, so older data is already rolled up when it is read.
+DEFAULT_TIERS = (
+    (10, 360),      # 10 s resolution for the last hour
+    (60, 1440),     # 1 min min/avg/max for the last day
+    (3600, 720)     # 1 h min/avg/max for the last 30 days
+)
+
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+# Upper bound on points returned when no step is requested
+MAX_POINTS = 360
+
+# A series written within this many seconds is live (longer than any
+# collection interval) and is never evicted for a new one
+IDLE_AFTER = 600
+
+def _group(name):
+    """Host part of a series name; '' for this machine's own series"""
+    return name.split('/', 1)[0] if '/' in name else ''
+
+def parse_duration(value):
+    """Parse a duration such as '30s', '5m', '1h' or '7d' into seconds"""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*', str(value))
+    if not match:
+        raise ValueError(f"Invalid duration: {value}")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2) or 's']
+
+def flatten_sample(stats, services):
+    """Flatten SystemMonitor and DockerMonitor output into metric name/value pairs"""
+    metrics = {}
+    
+    if stats and 'error' not in stats:
+        for group, fields in (
+            ('cpu', ('percent',)),
+            ('memory', ('percent',)),
+            ('swap', ('percent',)),
+            ('disk', ('percent',)),
+            ('network', ('bytes_recv_per_sec', 'bytes_sent_per_sec',
+                         'packets_recv_per_sec', 'packets_sent_per_sec'))
+        ):
+            values = stats.get(group) or {}
+            for field in fields:
+                if values.get(field) is not None:
+                    metrics[f"{group}.{field}"] = values[field]
+        
+        # Named by device rather than mountpoint: '/' separates a remote
+        # host's name from its metric (see metric_name)
+        for disk in stats.get('disks') or []:
+            metrics[f"disks.{disk['device']}.percent"] = disk['percent']
+        for device, rates in (stats.get('disk_io') or {}).items():
+            for field in ('read_bytes_per_sec', 'write_bytes_per_sec', 'read_iops', 'write_iops'):
+                metrics[f"disk_io.{device}.{field}"] = rates[field]
+        for name, rates in (stats.get('interfaces') or {}).items():
+            for field in ('bytes_recv_per_sec', 'bytes_sent_per_sec'):
+                metrics[f"interfaces.{name}.{field}"] = rates[field]
+    
+    for service in services or []:
+        if 'cpu_percent' not in service:
+            continue
+        prefix = f"container.{service['name']}"
+        metrics[f"{prefix}.cpu_percent"] = service['cpu_percent']
+        metrics[f"{prefix}.memory_percent"] = service['memory_percent']
+        metrics[f"{prefix}.memory_usage"] = service['memory_usage']
+    
+    return metrics
+
+class _Tier:
+    """Fixed-size ring of min/sum/max/count buckets for one metric"""
+    
+    __slots__ = ('step', 'capacity', 'buckets', 'mins', 'maxs', 'sums', 'counts')
+    
+    def __init__(self, step, capacity):
+        self.step = step
+        self.capacity = capacity
+        self.buckets = array('q', [-1]) * capacity
+        self.mins = array('f', [0.0]) * capacity
+        self.maxs = array('f', [0.0]) * capacity
+        self.sums = array('d', [0.0]) * capacity
+        self.counts = array('I', [0]) * capacity
+    
+    @property
+    def retention(self):
+        return self.step * self.capacity
+    
+    def add(self, ts, value):
+        bucket = int(ts // self.step)
+        i = bucket % self.capacity
+        
+        if self.buckets[i] > bucket:
+            # Late sample older than the ring holds
+            return
+        if self.buckets[i] != bucket:
+            # Slot still holds a bucket from a previous lap of the ring
+            self.buckets[i] = bucket
+            self.mins[i] = self.maxs[i] = self.sums[i] = value
+            self.counts[i] = 1
+            return
+        
+        if value < self.mins[i]:
+            self.mins[i] = value
+        if value > self.maxs[i]:
+            self.maxs[i] = value
+        self.sums[i] += value
+        self.counts[i] += 1
+    
+    def buckets_between(self, start, end):
+        """Yield (bucket start, min, sum, max, count) for live buckets in range"""
+        first = max(int(start // self.step), int(end // self.step) - self.capacity + 1)
+        for bucket in range(first, int(end // self.step) + 1):
+            i = bucket % self.capacity
+            if self.buckets[i] == bucket:
+                yield bucket * self.step, self.mins[i], self.sums[i], self.maxs[i], self.counts[i]
+
+class MetricsHistory:
+    """In-process, array-backed time-series history with min/avg/max rollups"""
+    
+    def __init__(self, tiers=DEFAULT_TIERS, max_series=None):
+        self.tiers = tiers
+        # Per host, so a remote host's series can't push out this one's
+        self.max_series = max_series or int(os.environ.get('HISTORY_MAX_SERIES', 256))
+        self._series = {}
+        # Last write of each series per host, oldest first
+        self._written = {}
+        # When each series was (re)created; it holds nothing from before
+        self._created = {}
+        self._lock = threading.Lock()
+        self.started = None
+    
+    def record(self, metrics, ts=None):
+        """Add one value per metric at the given epoch timestamp"""
+        ts = ts or time.time()
+        with self._lock:
+            if self.started is None:
+                self.started = ts
+            for name, value in metrics.items():
+                group = _group(name)
+                written = self._written.get(group)
+                if written is None:
+                    written = self._written[group] = OrderedDict()
+                series = self._series.get(name)
+                if series is None:
+                    if len(written) >= self.max_series:
+                        # Keep memory bounded when containers churn: a series
+                        # nobody writes any more (e.g. a removed container)
+                        # makes room. With every series live the new one is
+                        # left out instead, so they don't evict each other
+                        # on every tick; the metrics store has both
+                        idlest, last = next(iter(written.items()))
+                        if ts - last < IDLE_AFTER:
+                            HISTORY_EVICTIONS.inc(outcome='skipped')
+                            continue
+                        del written[idlest]
+                        del self._series[idlest]
+                        del self._created[idlest]
+                        HISTORY_EVICTIONS.inc(outcome='evicted')
+                    series = self._series[name] = [_Tier(step, capacity) for step, capacity in self.tiers]
+                    self._created[name] = ts
+                written[name] = max(ts, written.get(name, ts))
+                written.move_to_end(name)
+                for tier in series:
+                    tier.add(ts, float(value))
+    
+    def record_sample(self, stats, services, ts=None):
+        """Record one collector tick of system stats and container services"""
+        self.record(flatten_sample(stats, services), ts)
+    
+    def metrics(self):
+        """List the names of all recorded metrics"""
+        with self._lock:
+            return sorted(self._series)
+    
+    def covers(self, start, metric=None):
+        """Whether every sample since start (of one metric, if given) is still held in memory"""
+        oldest = time.time() - max(step * capacity for step, capacity in self.tiers)
+        with self._lock:
+            created = self.started if metric is None else self._created.get(metric)
+        return created is not None and created <= start and start >= oldest
+    
+    def query(self, metric, start, end, step=None):
+        """Get min/avg/max points for a metric, downsampled to step seconds"""
+        with self._lock:
+            series = self._series.get(metric)
+            if series is None:
+                return None, []
+            
+            # Finest tier that still covers the start of the range
+            span = time.time() - start
+            tier = next((t for t in series if t.retention + t.step >= span), series[-1])
+            if step is None:
+                step = (end - start) / MAX_POINTS
+            step = max(tier.step, int(step // tier.step) * tier.step)
+            
+            points = {}
+            for ts, low, total, high, count in tier.buckets_between(start, end):
+                key = int(ts // step) * step
+                point = points.get(key)
+                if point is None:
+                    points[key] = [low, total, high, count]
+                    continue
+                point[0] = min(point[0], low)
+                point[1] += total
+                point[2] = max(point[2], high)
+                point[3] += count
+        
+        return step, [
+            {
+                't': ts,
+                'min': round(low, 2),
+                'avg': round(total / count, 2),
+                'max': round(high, 2)
+            }
+            for ts, (low, total, high, count) in sorted(points.items())
+        ]
\ No newline at end of file
@@ -0,0 +1,369 @@
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from utils.metrics_history import MAX_POINTS, flatten_sample
+from utils.instrumentation import metrics, COLLECTOR_SECONDS, COLLECTOR_ERRORS
+from utils.export import iter_query
+
+# Rollup resolutions (seconds) and how long each one is kept
+ROLLUP_RETENTION = {
+    60: 30 * 86400,
+    3600: 365 * 86400
+}
+
+# Rollups are recomputed over this window so late samples are included
+ROLLUP_LOOKBACK = 3600
+
+class MetricsStore:
+    """Durable metric history in SQLite with batched writes and background rollups"""
+    
+    def __init__(self, db_path=None, batch_size=None, flush_interval=None,
+                 raw_retention=None, maintenance_interval=None, read_only=False):
+        self.db_path = db_path or os.environ.get('METRICS_DB_PATH', 'data/metrics.db')
+        # One transaction per batch_size collector ticks, or per flush_interval
+        self.batch_size = batch_size or int(os.environ.get('METRICS_BATCH_SIZE', 6))
+        self.flush_interval = flush_interval or float(os.environ.get('METRICS_FLUSH_INTERVAL', 60))
+        self.raw_retention = raw_retention or int(os.environ.get('METRICS_RAW_RETENTION', 2 * 86400))
+        self.maintenance_interval = maintenance_interval or float(os.environ.get('METRICS_MAINTENANCE_INTERVAL', 300))
+        # Read-only stores query a database another process writes to
+        self.read_only = read_only
+        
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._metric_ids = {}
+        self._ids_lock = threading.Lock()
+        
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.init_db()
+        
+        self._writer = None
+        if not read_only:
+            self._writer = threading.Thread(target=self._write_loop, name='metrics-writer', daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
+    
+    def _connect(self):
+        """Open a connection with WAL and write-friendly pragmas"""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+    
+    def _reader(self):
+        """Per-thread read connection; WAL lets readers run alongside the writer"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+    
+    def init_db(self):
+        """Create metric tables and indexes"""
+        conn = self._connect()
+        try:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS metric_names (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE
+                );
+                
+                CREATE TABLE IF NOT EXISTS samples (
+                    metric_id INTEGER NOT NULL,
+                    ts INTEGER NOT NULL,
+                    value REAL NOT NULL,
+                    PRIMARY KEY (metric_id, ts)
+                ) WITHOUT ROWID;
+                
+                CREATE INDEX IF NOT EXISTS idx_samples_ts ON samples (ts);
+                
+                CREATE TABLE IF NOT EXISTS rollups (
+                    resolution INTEGER NOT NULL,
+                    metric_id INTEGER NOT NULL,
+                    ts INTEGER NOT NULL,
+                    min REAL NOT NULL,
+                    avg REAL NOT NULL,
+                    max REAL NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (resolution, metric_id, ts)
+                ) WITHOUT ROWID;
+                
+                CREATE INDEX IF NOT EXISTS idx_rollups_ts ON rollups (resolution, ts);
+                
+                CREATE TABLE IF NOT EXISTS rollup_state (
+                    resolution INTEGER PRIMARY KEY,
+                    watermark INTEGER NOT NULL
+                );
+            ''')
+            conn.commit()
+            self._load_metric_ids(conn)
+        finally:
+            conn.close()
+    
+    def _load_metric_ids(self, conn):
+        """Reload the metric name -> id map from the database"""
+        with self._ids_lock:
+            self._metric_ids = dict(
+                (name, metric_id) for metric_id, name in conn.execute('SELECT id, name FROM metric_names')
+            )
+    
+    def record(self, metrics, ts=None):
+        """Queue one value per metric; the writer thread commits them in batches"""
+        if metrics and not self.read_only:
+            self._queue.put((int(ts or time.time()), metrics))
+    
+    def record_sample(self, stats, services, ts=None):
+        """Queue one collector tick of system stats and container services"""
+        self.record(flatten_sample(stats, services), ts)
+    
+    def pending(self):
+        """Number of queued writes not yet committed"""
+        return self._queue.qsize()
+    
+    def flush(self, timeout=10):
+        """Block until everything queued so far has been committed"""
+        if self.read_only:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+    
+    def close(self):
+        """Commit pending samples and stop the writer thread"""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=10)
+    
+    def metrics(self):
+        """List the names of all stored metrics"""
+        if self.read_only:
+            # Another process adds metrics as containers come and go
+            self._load_metric_ids(self._reader())
+        with self._ids_lock:
+            return sorted(self._metric_ids)
+    
+    def query(self, metric, start, end, step=None):
+        """Get min/avg/max points for a metric, downsampled to step seconds"""
+        with self._ids_lock:
+            metric_id = self._metric_ids.get(metric)
+        if metric_id is None and self.read_only:
+            self._load_metric_ids(self._reader())
+            with self._ids_lock:
+                metric_id = self._metric_ids.get(metric)
+        if metric_id is None:
+            return None, []
+        
+        start, end = int(start), int(end)
+        if step is None:
+            step = (end - start) / MAX_POINTS
+        
+        # Raw samples while they cover the range, otherwise the coarsest
+        # rollup that is still finer than the requested step
+        now = time.time()
+        resolution = None
+        if start < now - self.raw_retention or step >= 60:
+            resolution = 3600 if start < now - ROLLUP_RETENTION[60] or step >= 3600 else 60
+        base = resolution or 1
+        step = max(base, int(step // base) * base)
+        
+        conn = self._reader()
+        points = {}
+        raw_from = start
+        if resolution:
+            row = conn.execute(
+                'SELECT watermark FROM rollup_state WHERE resolution = ?', (resolution,)
+            ).fetchone()
+            watermark = min(row[0], end) if row else start
+            for bucket, low, total, high, count in conn.execute('''
+                SELECT (ts / ?) * ? AS bucket, MIN(min), SUM(avg * count), MAX(max), SUM(count)
+                FROM rollups
+                WHERE resolution = ? AND metric_id = ? AND ts >= ? AND ts < ?
+                GROUP BY bucket
+            ''', (step, step, resolution, metric_id, start, watermark)):
+                points[bucket] = [low, total, high, count]
+            # Buckets newer than the last rollup come from raw samples
+            raw_from = max(start, watermark)
+        
+        for bucket, low, total, high, count in conn.execute('''
+            SELECT (ts / ?) * ? AS bucket, MIN(value), SUM(value), MAX(value), COUNT(*)
+            FROM samples
+            WHERE metric_id = ? AND ts >= ? AND ts <= ?
+            GROUP BY bucket
+        ''', (step, step, metric_id, raw_from, end)):
+            point = points.get(bucket)
+            if point is None:
+                points[bucket] = [low, total, high, count]
+                continue
+            point[0] = min(point[0], low)
+            point[1] += total
+            point[2] = max(point[2], high)
+            point[3] += count
+        
+        return step, [
+            {
+                't': ts,
+                'min': round(low, 2),
+                'avg': round(total / count, 2),
+                'max': round(high, 2)
+            }
+            for ts, (low, total, high, count) in sorted(points.items())
+        ]
+    
+    def export(self, start=None, end=None, metric=None, resolution=None):
+        """Stored samples (or rollups at resolution seconds) as (columns, row chunks)"""
+        conditions = []
+        params = []
+        if resolution:
+            columns = ('metric', 'ts', 'min', 'avg', 'max', 'count')
+            query = '''
+                SELECT metric_names.name, ts, min, avg, max, count
+                FROM rollups JOIN metric_names ON metric_names.id = rollups.metric_id
+            '''
+            conditions.append('resolution = ?')
+            params.append(int(resolution))
+        else:
+            columns = ('metric', 'ts', 'value')
+            query = '''
+                SELECT metric_names.name, ts, value
+                FROM samples JOIN metric_names ON metric_names.id = samples.metric_id
+            '''
+        if metric:
+            conditions.append('metric_names.name = ?')
+            params.append(metric)
+        if start is not None:
+            conditions.append('ts >= ?')
+            params.append(int(start))
+        if end is not None:
+            conditions.append('ts < ?')
+            params.append(int(end))
+        if conditions:
+            query += f" WHERE {' AND '.join(conditions)}"
+        return columns, iter_query(self.db_path, query + ' ORDER BY ts', params)
+    
+    def _write_loop(self):
+        """Group queued samples into transactions and run periodic maintenance"""
+        conn = self._connect()
+        pending = []
+        waiters = []
+        last_flush = last_maintenance = time.monotonic()
+        running = True
+        
+        while running:
+            timeout = max(0.1, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+            
+            if item is None:
+                running = False
+            elif isinstance(item, threading.Event):
+                waiters.append(item)
+            elif item is not False:
+                pending.append(item)
+            
+            now = time.monotonic()
+            due = now - last_flush >= self.flush_interval
+            if pending and (len(pending) >= self.batch_size or due or waiters or not running):
+                with metrics.timed(COLLECTOR_SECONDS, phase='metrics_insert'):
+                    self._write_batch(conn, pending)
+                pending = []
+                last_flush = now
+            elif not pending:
+                last_flush = now
+            
+            for waiter in waiters:
+                waiter.set()
+            waiters = []
+            
+            if running and now - last_maintenance >= self.maintenance_interval:
+                with metrics.timed(COLLECTOR_SECONDS, phase='metrics_maintenance'):
+                    self._run_maintenance(conn)
+                last_maintenance = time.monotonic()
+        
+        conn.close()
+    
+    def _metric_id(self, cursor, name):
+        """Get or create the id of a metric name inside the current transaction"""
+        metric_id = self._metric_ids.get(name)
+        if metric_id is None:
+            cursor.execute('INSERT OR IGNORE INTO metric_names (name) VALUES (?)', (name,))
+            metric_id = cursor.execute('SELECT id FROM metric_names WHERE name = ?', (name,)).fetchone()[0]
+            with self._ids_lock:
+                self._metric_ids[name] = metric_id
+        return metric_id
+    
+    def _write_batch(self, conn, batch):
+        """Insert a batch of samples in a single transaction"""
+        try:
+            cursor = conn.cursor()
+            rows = [
+                (self._metric_id(cursor, name), ts, float(value))
+                for ts, metrics in batch
+                for name, value in metrics.items()
+            ]
+            cursor.executemany(
+                'INSERT OR REPLACE INTO samples (metric_id, ts, value) VALUES (?, ?, ?)',
+                rows
+            )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error writing metrics batch: {e}")
+            COLLECTOR_ERRORS.inc(phase='metrics_insert')
+            # Ids handed out inside the rolled back transaction are gone
+            self._load_metric_ids(conn)
+    
+    def _run_maintenance(self, conn):
+        """Roll up finished buckets and drop data past its retention"""
+        try:
+            now = int(time.time())
+            self._rollup(conn, 60, 'samples', now)
+            self._rollup(conn, 3600, 'rollups', now)
+            
+            conn.execute('DELETE FROM samples WHERE ts < ?', (now - self.raw_retention,))
+            for resolution, retention in ROLLUP_RETENTION.items():
+                conn.execute(
+                    'DELETE FROM rollups WHERE resolution = ? AND ts < ?',
+                    (resolution, now - retention)
+                )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error running metrics maintenance: {e}")
+            COLLECTOR_ERRORS.inc(phase='metrics_maintenance')
+    
+    def _rollup(self, conn, resolution, source, now):
+        """Aggregate completed buckets from the source table into rollups"""
+        row = conn.execute(
+            'SELECT watermark FROM rollup_state WHERE resolution = ?', (resolution,)
+        ).fetchone()
+        upto = now // resolution * resolution
+        since = min(row[0], upto - ROLLUP_LOOKBACK) if row else 0
+        
+        if source == 'samples':
+            conn.execute('''
+                INSERT OR REPLACE INTO rollups (resolution, metric_id, ts, min, avg, max, count)
+                SELECT ?, metric_id, (ts / ?) * ? AS bucket, MIN(value), AVG(value), MAX(value), COUNT(*)
+                FROM samples
+                WHERE ts >= ? AND ts < ?
+                GROUP BY metric_id, bucket
+            ''', (resolution, resolution, resolution, since, upto))
+        else:
+            conn.execute('''
+                INSERT OR REPLACE INTO rollups (resolution, metric_id, ts, min, avg, max, count)
+                SELECT ?, metric_id, (ts / ?) * ? AS bucket, MIN(min),
+                       SUM(avg * count) / SUM(count), MAX(max), SUM(count)
+                FROM rollups
+                WHERE resolution = 60 AND ts >= ? AND ts < ?
+                GROUP BY metric_id, bucket
+            ''', (resolution, resolution, resolution, since, upto))
+        
+        conn.execute(
+            'INSERT OR REPLACE INTO rollup_state (resolution, watermark) VALUES (?, ?)',
+            (resolution, upto)
+        )
\ No newline at end of file
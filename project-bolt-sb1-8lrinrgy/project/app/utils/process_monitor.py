@@ -0,0 +1,169 @@
+import heapq
+import os
+import threading
+import time
+import psutil
+from utils.instrumentation import metrics, COLLECTOR_SECONDS, COLLECTOR_ERRORS
+
+# Row field each top-N list is ranked by
+SORT_KEYS = {
+    'cpu': 'cpu_percent',
+    'memory': 'memory_rss',
+    'io': 'io_bytes_per_sec'
+}
+
+# Seconds between the priming pass and the first one with rates; CPU time
+# is counted in clock ticks, so a shorter gap gives coarse percentages
+PRIME_DELAY = 0.5
+
+class ProcessMonitor:
+    """Per-process CPU, memory and IO rates from one bounded pass over /proc
+    
+    Process objects are kept between ticks so CPU and IO are deltas of the
+    cumulative counters instead of blocking samples. Each process is read
+    inside oneshot() so its /proc files are parsed once per tick, and at
+    most max_scan processes are read per tick; on larger hosts the scan
+    rotates through the process table and the rest keep their last rates.
+    A priming pass at construction gives the first real one its baseline.
+    """
+    
+    def __init__(self, max_scan=None, min_interval=None):
+        self.max_scan = max_scan or int(os.environ.get('PROCESS_MAX_SCAN', 2000))
+        # Requests in between ticks reuse the last pass instead of rescanning
+        self.min_interval = min_interval or float(os.environ.get('PROCESS_MIN_INTERVAL', 2))
+        self.memory_total = psutil.virtual_memory().total
+        
+        self._entries = {}
+        self._offset = 0
+        self._last_scan = 0
+        self._summary = {}
+        self._scans = 0
+        self._lock = threading.Lock()
+        self._scan()
+    
+    def collect(self):
+        """Scan processes if the last pass is older than min_interval"""
+        with self._lock:
+            self._refresh()
+            return dict(self._summary)
+    
+    def top(self, sort='cpu', limit=10):
+        """Get the top processes by 'cpu', 'memory' or 'io'"""
+        key = SORT_KEYS[sort]
+        with self._lock:
+            self._refresh()
+            rows = [entry['row'] for entry in self._entries.values() if entry['row'] is not None]
+        return [dict(row) for row in heapq.nlargest(limit, rows, key=lambda row: row[key] or 0)]
+    
+    def snapshot(self, limit=10):
+        """Summary plus top-N lists for every sort order"""
+        summary = self.collect()
+        summary.update({f"top_{sort}": self.top(sort, limit) for sort in SORT_KEYS})
+        return summary
+    
+    def _refresh(self):
+        now = time.monotonic()
+        if self._scans == 1:
+            # Only the priming pass so far, which has no rates
+            time.sleep(max(0, self._last_scan + PRIME_DELAY - now))
+            self._scan()
+        elif now - self._last_scan >= self.min_interval:
+            self._scan()
+    
+    def _scan(self):
+        with metrics.timed(COLLECTOR_SECONDS, COLLECTOR_ERRORS, phase='process_scan'):
+            self._scan_processes()
+    
+    def _scan_processes(self):
+        started = time.monotonic()
+        pids = psutil.pids()
+        
+        # Forget processes that have exited
+        alive = set(pids)
+        for pid in [pid for pid in self._entries if pid not in alive]:
+            del self._entries[pid]
+        
+        if len(pids) > self.max_scan:
+            self._offset %= len(pids)
+            batch = (pids[self._offset:] + pids[:self._offset])[:self.max_scan]
+            self._offset += self.max_scan
+        else:
+            batch = pids
+        
+        errors = 0
+        for pid in batch:
+            try:
+                self._sample(pid, started)
+            except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                self._entries.pop(pid, None)
+            except psutil.AccessDenied:
+                errors += 1
+        
+        self._last_scan = time.monotonic()
+        self._scans += 1
+        self._summary = {
+            'total': len(pids),
+            'scanned': len(batch),
+            'denied': errors,
+            'scan_ms': round((self._last_scan - started) * 1000, 1)
+        }
+    
+    def _sample(self, pid, now):
+        """Read one process and update its rates against the previous tick"""
+        entry = self._entries.get(pid)
+        if entry is None:
+            entry = self._entries[pid] = {
+                'process': psutil.Process(pid),
+                'cpu': None,
+                'io': None,
+                'sampled': None,
+                'username': None,
+                'row': None
+            }
+        process = entry['process']
+        
+        with process.oneshot():
+            cpu_times = process.cpu_times()
+            memory = process.memory_info()
+            name = process.name()
+            try:
+                io = process.io_counters()
+                io = io.read_bytes + io.write_bytes, io.read_bytes, io.write_bytes
+            except (psutil.AccessDenied, AttributeError):
+                # Other users' IO counters need root; macOS has none at all
+                io = None
+        cpu = cpu_times.user + cpu_times.system
+        
+        # Cumulative CPU going backwards means the pid was reused
+        if entry['cpu'] is not None and cpu < entry['cpu']:
+            entry.update({'process': psutil.Process(pid), 'cpu': None, 'io': None, 'username': None})
+        
+        cpu_percent = io_rate = read_rate = write_rate = None
+        if entry['sampled'] is not None and entry['cpu'] is not None:
+            elapsed = now - entry['sampled']
+            if elapsed > 0:
+                cpu_percent = round((cpu - entry['cpu']) / elapsed * 100, 1)
+                if io is not None and entry['io'] is not None:
+                    io_rate, read_rate, write_rate = (
+                        round(max(0, current - previous) / elapsed, 1)
+                        for current, previous in zip(io, entry['io'])
+                    )
+        
+        if entry['username'] is None:
+            try:
+                entry['username'] = process.username()
+            except (psutil.AccessDenied, KeyError):
+                entry['username'] = ''
+        
+        entry.update({'cpu': cpu, 'io': io, 'sampled': now})
+        entry['row'] = {
+            'pid': pid,
+            'name': name,
+            'username': entry['username'],
+            'cpu_percent': cpu_percent,
+            'memory_rss': memory.rss,
+            'memory_percent': round(memory.rss / self.memory_total * 100, 2),
+            'io_bytes_per_sec': io_rate,
+            'io_read_per_sec': read_rate,
+            'io_write_per_sec': write_rate
+        }
\ No newline at end of file
@@ -0,0 +1,54 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+class SharedState:
+    """Latest collector output shared between processes as small JSON files
+    
+    Each key is published with an atomic rename, so readers in other
+    processes never see a half-written file. Readers keep the parsed value
+    until the file is replaced.
+    """
+    
+    def __init__(self, path=None):
+        self.path = path or os.environ.get('SHARED_STATE_DIR', 'data/shared')
+        os.makedirs(self.path, exist_ok=True)
+        self._cache = {}
+        self._lock = threading.Lock()
+    
+    def _file(self, key):
+        return os.path.join(self.path, f"{key}.json")
+    
+    def publish(self, key, value):
+        """Replace the value of a key for every reader"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix=f".{key}.", suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'published': time.time(), 'value': value}, f, default=str)
+            os.replace(tmp_path, self._file(key))
+        except Exception as e:
+            print(f"Error publishing shared state {key}: {e}")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+    
+    def get(self, key, default=None):
+        """Get the latest published value of a key"""
+        try:
+            info = os.stat(self._file(key))
+        except FileNotFoundError:
+            return default
+        version = (info.st_ino, info.st_mtime_ns)
+        
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is None or cached[0] != version:
+                try:
+                    with open(self._file(key)) as f:
+                        cached = (version, json.load(f))
+                except (OSError, ValueError) as e:
+                    print(f"Error reading shared state {key}: {e}")
+                    return default
+                self._cache[key] = cached
+        return cached[1]['value']
\ No newline at end of file
@@ -1,30 +1,106 @@
 import psutil
+import fnmatch
+import os
 import platform
+import select
+import threading
+import time
 from datetime import datetime
+from utils.instrumentation import metrics, COLLECTOR_SECONDS, COLLECTOR_ERRORS
+
+# Filesystems that never hold user data even when backed by a device
+PSEUDO_FSTYPES = {'squashfs', 'iso9660', 'udf', 'overlay', 'aufs', 'tmpfs', 'devtmpfs', 'ramfs'}
+
+def _patterns(value):
+    return [pattern.strip() for pattern in value.split(',') if pattern.strip()]
 
 class SystemMonitor:
     """Monitor system statistics using psutil"""
     
-    def __init__(self):
+    def __init__(self, max_mounts=None, max_devices=None, max_interfaces=None):
         self.boot_time = datetime.fromtimestamp(psutil.boot_time())
+        self.cpu_count = psutil.cpu_count()
+        
+        # Every tick reads each mount, block device and interface once, so
+        # these caps bound the work on hosts with many of them
+        self.max_mounts = max_mounts or int(os.environ.get('DISK_MAX_MOUNTS', 16))
+        self.max_devices = max_devices or int(os.environ.get('DISK_MAX_DEVICES', 16))
+        self.max_interfaces = max_interfaces or int(os.environ.get('NET_MAX_INTERFACES', 16))
+        self.exclude_devices = _patterns(os.environ.get('DISK_EXCLUDE_DEVICES', 'loop*,ram*,zram*,fd*,sr*'))
+        self.exclude_interfaces = _patterns(os.environ.get('NET_EXCLUDE_INTERFACES', 'lo,veth*'))
+        # Without mount change notifications the partition list is re-read this often
+        self.partitions_refresh = float(os.environ.get('DISK_PARTITIONS_REFRESH', 300))
+        # Link state and speed can change without the interface list changing
+        self.nic_stats_refresh = float(os.environ.get('NET_STATS_REFRESH', 30))
+        
+        self._partitions = None
+        self._partitions_read = 0
+        self._mounts_file = None
+        self._mounts_poll = self._watch_mounts()
+        self._nic_stats = {}
+        self._nic_stats_read = 0
+        
+        # Percentages and rates are computed from the delta between two
+        # snapshots, so a stats call never has to sleep to take a sample
+        self._lock = threading.Lock()
+        self._last_cpu_times = psutil.cpu_times()
+        self._last_percpu_times = psutil.cpu_times(percpu=True)
+        self._last_net_io = psutil.net_io_counters()
+        self._last_disk_io = self._read_disk_io()
+        self._last_nic_io = self._read_nic_io()
+        self._last_sample = time.monotonic()
     
     def get_system_stats(self):
         """Get comprehensive system statistics"""
         try:
+            # CPU and network rates since the previous call
+            with self._lock:
+                now = time.monotonic()
+                elapsed = now - self._last_sample
+                
+                with metrics.timed(COLLECTOR_SECONDS, COLLECTOR_ERRORS, phase='psutil_cpu'):
+                    cpu_times = psutil.cpu_times()
+                    percpu_times = psutil.cpu_times(percpu=True)
+                with metrics.timed(COLLECTOR_SECONDS, COLLECTOR_ERRORS, phase='psutil_net'):
+                    net_io = psutil.net_io_counters()
+                    nic_io = self._read_nic_io()
+                with metrics.timed(COLLECTOR_SECONDS, COLLECTOR_ERRORS, phase='psutil_disk_io'):
+                    disk_io = self._read_disk_io()
+                
+                cpu_percent = self._cpu_percent(self._last_cpu_times, cpu_times)
+                per_core = [
+                    round(self._cpu_percent(prev, cur), 1)
+                    for prev, cur in zip(self._last_percpu_times, percpu_times)
+                ]
+                net_rates = self._net_rates(self._last_net_io, net_io, elapsed)
+                interfaces = {
+                    name: dict(self._nic_info(name), **self._net_rates(self._last_nic_io.get(name), counters, elapsed))
+                    for name, counters in nic_io.items()
+                }
+                disk_rates = {
+                    name: self._disk_rates(self._last_disk_io.get(name), counters, elapsed)
+                    for name, counters in disk_io.items()
+                }
+                
+                self._last_cpu_times = cpu_times
+                self._last_percpu_times = percpu_times
+                self._last_net_io = net_io
+                self._last_nic_io = nic_io
+                self._last_disk_io = disk_io
+                self._last_sample = now
+            
             # CPU information
-            cpu_percent = psutil.cpu_percent(interval=1)
-            cpu_count = psutil.cpu_count()
             cpu_freq = psutil.cpu_freq()
             
             # Memory information
-            memory = psutil.virtual_memory()
-            swap = psutil.swap_memory()
+            with metrics.timed(COLLECTOR_SECONDS, COLLECTOR_ERRORS, phase='psutil_memory'):
+                memory = psutil.virtual_memory()
+                swap = psutil.swap_memory()
             
             # Disk information
-            disk = psutil.disk_usage('/')
-            
-            # Network information
-            net_io = psutil.net_io_counters()
+            with metrics.timed(COLLECTOR_SECONDS, COLLECTOR_ERRORS, phase='psutil_disk'):
+                disk = psutil.disk_usage('/')
+                disks = self._disk_usage()
             
             # System information
             uptime = datetime.now() - self.boot_time
@@ -32,7 +108,8 @@ class SystemMonitor:
             return {
                 'cpu': {
                     'percent': round(cpu_percent, 1),
-                    'count': cpu_count,
+                    'per_core': per_core,
+                    'count': self.cpu_count,
                     'frequency': round(cpu_freq.current, 2) if cpu_freq else 0
                 },
                 'memory': {
@@ -52,12 +129,16 @@ class SystemMonitor:
                     'free': disk.free,
                     'percent': round((disk.used / disk.total) * 100, 1)
                 },
+                'disks': disks,
+                'disk_io': disk_rates,
                 'network': {
                     'bytes_sent': net_io.bytes_sent,
                     'bytes_recv': net_io.bytes_recv,
                     'packets_sent': net_io.packets_sent,
-                    'packets_recv': net_io.packets_recv
+                    'packets_recv': net_io.packets_recv,
+                    **net_rates
                 },
+                'interfaces': interfaces,
                 'system': {
                     'platform': platform.system(),
                     'platform_version': platform.version(),
@@ -73,23 +154,179 @@ class SystemMonitor:
                 'timestamp': datetime.now().isoformat()
             }
     
-    def get_process_info(self, limit=10):
-        """Get top processes by CPU usage"""
+    def _cpu_busy_time(self, times):
+        """Split a cpu_times snapshot into (busy, total) seconds"""
+        total = sum(times)
+        # guest time is already accounted for in user/nice on Linux
+        total -= getattr(times, 'guest', 0) + getattr(times, 'guest_nice', 0)
+        idle = times.idle + getattr(times, 'iowait', 0)
+        return total - idle, total
+    
+    def _cpu_percent(self, prev, cur):
+        """CPU usage percentage between two cpu_times snapshots"""
+        prev_busy, prev_total = self._cpu_busy_time(prev)
+        cur_busy, cur_total = self._cpu_busy_time(cur)
+        
+        total_delta = cur_total - prev_total
+        if total_delta <= 0:
+            return 0.0
+        busy_delta = max(0, cur_busy - prev_busy)
+        return min(100.0, busy_delta / total_delta * 100)
+    
+    def _net_rates(self, prev, cur, elapsed):
+        """Per-second network rates between two net_io_counters snapshots"""
+        fields = ('bytes_sent', 'bytes_recv', 'packets_sent', 'packets_recv')
+        if prev is None or elapsed <= 0:
+            return {f"{field}_per_sec": 0 for field in fields}
+        return {
+            # Counters can wrap or reset when interfaces go away
+            f"{field}_per_sec": round(max(0, getattr(cur, field) - getattr(prev, field)) / elapsed, 1)
+            for field in fields
+        }
+    
+    def _disk_rates(self, prev, cur, elapsed):
+        """Throughput, IOPS and busy time between two disk_io_counters snapshots"""
+        if prev is None or elapsed <= 0:
+            rates = {'read_bytes_per_sec': 0, 'write_bytes_per_sec': 0, 'read_iops': 0, 'write_iops': 0}
+            if hasattr(cur, 'busy_time'):
+                rates['busy_percent'] = 0
+            return rates
+        
+        def rate(field):
+            return max(0, getattr(cur, field) - getattr(prev, field)) / elapsed
+        
+        rates = {
+            'read_bytes_per_sec': round(rate('read_bytes'), 1),
+            'write_bytes_per_sec': round(rate('write_bytes'), 1),
+            'read_iops': round(rate('read_count'), 1),
+            'write_iops': round(rate('write_count'), 1)
+        }
+        # busy_time (Linux) is milliseconds spent doing IO
+        if hasattr(cur, 'busy_time'):
+            rates['busy_percent'] = round(min(100.0, rate('busy_time') / 10), 1)
+        return rates
+    
+    def _read_disk_io(self):
+        """Per-device IO counters for whole disks, skipping excluded devices"""
         try:
-            processes = []
-            for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent']):
-                try:
-                    proc_info = proc.info
-                    if proc_info['cpu_percent'] > 0:
-                        processes.append(proc_info)
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    continue
-            
-            # Sort by CPU usage and return top processes
-            processes.sort(key=lambda x: x['cpu_percent'], reverse=True)
-            return processes[:limit]
+            counters = psutil.disk_io_counters(perdisk=True) or {}
         except Exception as e:
-            return []
+            print(f"Error reading disk IO counters: {e}")
+            return {}
+        
+        devices = {}
+        for name in sorted(counters):
+            if any(fnmatch.fnmatch(name, pattern) for pattern in self.exclude_devices):
+                continue
+            # Partitions are counted in their disk too; only whole disks
+            # (and device-mapper volumes) have an entry in /sys/block
+            if os.path.isdir('/sys/block') and not os.path.exists(f"/sys/block/{name}"):
+                continue
+            devices[name] = counters[name]
+            if len(devices) >= self.max_devices:
+                break
+        return devices
+    
+    def _read_nic_io(self):
+        """Per-interface network counters, skipping excluded interfaces"""
+        try:
+            counters = psutil.net_io_counters(pernic=True) or {}
+        except Exception as e:
+            print(f"Error reading interface counters: {e}")
+            return {}
+        
+        interfaces = {}
+        for name in sorted(counters):
+            if any(fnmatch.fnmatch(name, pattern) for pattern in self.exclude_interfaces):
+                continue
+            interfaces[name] = counters[name]
+            if len(interfaces) >= self.max_interfaces:
+                break
+        
+        # Re-read right away for a new interface, otherwise every
+        # nic_stats_refresh seconds so a link going down or renegotiating
+        # its speed shows up
+        if (set(interfaces) - set(self._nic_stats)
+                or time.monotonic() - self._nic_stats_read > self.nic_stats_refresh):
+            self._nic_stats_read = time.monotonic()
+            try:
+                self._nic_stats = psutil.net_if_stats()
+            except Exception as e:
+                print(f"Error reading interface stats: {e}")
+        return interfaces
+    
+    def _nic_info(self, name):
+        stats = self._nic_stats.get(name)
+        if stats is None:
+            return {}
+        return {'is_up': stats.isup, 'speed_mbps': stats.speed}
+    
+    def _watch_mounts(self):
+        """Poll object that fires when the mount table changes (Linux), or None"""
+        try:
+            mounts = open('/proc/self/mounts')
+            mounts.read()
+            poller = select.poll()
+            poller.register(mounts, select.POLLPRI | select.POLLERR)
+            self._mounts_file = mounts
+            return poller
+        except (OSError, AttributeError):
+            return None
+    
+    def _mounts_changed(self):
+        """Whether the partition list needs to be read again"""
+        if self._partitions is None:
+            return True
+        if self._mounts_poll is not None:
+            if not self._mounts_poll.poll(0):
+                return False
+            # Reading the file again re-arms the notification
+            self._mounts_file.seek(0)
+            self._mounts_file.read()
+            return True
+        return time.monotonic() - self._partitions_read > self.partitions_refresh
+    
+    def _get_partitions(self):
+        """Mounted filesystems backed by real devices, one mount per device"""
+        if not self._mounts_changed():
+            return self._partitions
+        
+        partitions = {}
+        for partition in psutil.disk_partitions(all=False):
+            if partition.fstype in PSEUDO_FSTYPES or not partition.device.startswith('/dev/'):
+                continue
+            if any(fnmatch.fnmatch(os.path.basename(partition.device), pattern) for pattern in self.exclude_devices):
+                continue
+            # Bind mounts repeat a device; keep its shortest mountpoint
+            current = partitions.get(partition.device)
+            if current is None or len(partition.mountpoint) < len(current.mountpoint):
+                partitions[partition.device] = partition
+        
+        self._partitions = sorted(partitions.values(), key=lambda partition: partition.mountpoint)[:self.max_mounts]
+        self._partitions_read = time.monotonic()
+        return self._partitions
+    
+    def _disk_usage(self):
+        """Usage of every mounted partition"""
+        disks = []
+        for partition in self._get_partitions():
+            try:
+                usage = psutil.disk_usage(partition.mountpoint)
+            except OSError as e:
+                # Unmounted since the partition list was read
+                print(f"Error reading disk usage of {partition.mountpoint}: {e}")
+                self._partitions = None
+                continue
+            disks.append({
+                'device': os.path.basename(partition.device),
+                'mountpoint': partition.mountpoint,
+                'fstype': partition.fstype,
+                'total': usage.total,
+                'used': usage.used,
+                'free': usage.free,
+                'percent': round((usage.used / usage.total) * 100, 1) if usage.total else 0
+            })
+        return disks
     
     def format_bytes(self, bytes_value):
         """Format bytes to human readable format"""
@@ -1,36 +1,134 @@
 import sqlite3
+import calendar
+import heapq
+import ipaddress
 import json
+import queue
+import threading
+import time
 from datetime import datetime, timedelta
 import geoip2.database
 import geoip2.errors
+import maxminddb
 import requests
 import os
+from utils.lru_cache import LRUCache
+from utils.hyperloglog import HyperLogLog
+from utils.export import iter_query
+from utils.instrumentation import metrics, COLLECTOR_SECONDS, COLLECTOR_ERRORS
+
+# MMAP maps the file and pages it in lazily (fast startup), MEMORY reads
+# it all up front (slower startup, lowest lookup latency)
+GEOIP_MODES = {
+    'auto': maxminddb.MODE_AUTO,
+    'mmap': maxminddb.MODE_MMAP,
+    'memory': maxminddb.MODE_MEMORY,
+    'file': maxminddb.MODE_FILE
+}
+
+# Seconds per series bucket for get_visit_analytics
+BUCKET_SECONDS = {
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400
+}
+
+# Longest series get_visit_analytics returns
+MAX_BUCKETS = 5000
+
+# Top-N dimensions kept in visit_dimensions
+DIMENSIONS = ('country', 'city', 'user_agent')
 
 class VisitorTracker:
     """Track website visitors with GeoIP lookup"""
     
-    def __init__(self, db_path='visitors.db'):
-        self.db_path = db_path
+    # Longer user agents are truncated in the top-N rollups
+    USER_AGENT_LENGTH = 256
+    
+    def __init__(self, db_path=None, batch_size=None, flush_interval=None, shared=False):
+        self.db_path = db_path or os.environ.get('VISITS_DB_PATH', 'visitors.db')
+        # Other processes write to the same database, so counters are
+        # reloaded from the summary tables instead of kept in memory
+        self.shared = shared
         self.geoip_db_path = 'GeoLite2-City.mmdb'
         self.geoip_reader = None
+        self.geoip_mode = os.environ.get('GEOIP_MODE', 'auto').lower()
+        
+        # Visitors come back with the same IPs, so lookups are cached
+        self.geo_cache = LRUCache(
+            maxsize=int(os.environ.get('GEOIP_CACHE_SIZE', 4096)),
+            ttl=float(os.environ.get('GEOIP_CACHE_TTL', 86400))
+        )
+        
+        # Visits are written by a single thread that group-commits whatever
+        # arrived within flush_interval seconds (or batch_size rows)
+        self.batch_size = batch_size or int(os.environ.get('VISITS_BATCH_SIZE', 100))
+        self.flush_interval = flush_interval or float(os.environ.get('VISITS_FLUSH_INTERVAL', 0.005))
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        
+        # Minute counts and the hourly top-N/unique rollups are pruned after
+        # these many seconds; hourly counts and daily rollups are kept
+        self.minute_retention = int(os.environ.get('VISITS_MINUTE_RETENTION', 2 * 86400))
+        self.hourly_retention = int(os.environ.get('VISITS_HOURLY_RETENTION', 8 * 86400))
+        self._last_prune = 0
+        
+        # Running totals kept in step with the summary tables, so reading
+        # stats costs the same however many rows the visits table holds
+        self._counters_lock = threading.Lock()
+        self._total_visits = 0
+        self._unique_visitors = 0
+        self._country_visits = {}
+        self._hourly_visits = {}
         
-        # Initialize GeoIP database
-        self._init_geoip()
+        # The GeoIP database is opened on the first lookup, not at startup
+        self._geoip_opened = False
+        self._geoip_lock = threading.Lock()
+        
+        self._writer = threading.Thread(target=self._write_loop, name='visits-writer', daemon=True)
+        self._writer.start()
+    
+    def geoip(self):
+        """The GeoIP reader, opened once by whichever thread needs it first"""
+        if self.geoip_reader is None and not self._geoip_opened:
+            with self._geoip_lock:
+                if not self._geoip_opened:
+                    self._init_geoip()
+                    self._geoip_opened = True
+        return self.geoip_reader
     
     def _init_geoip(self):
         """Initialize GeoIP database"""
         try:
             if os.path.exists(self.geoip_db_path):
-                self.geoip_reader = geoip2.database.Reader(self.geoip_db_path)
+                mode = GEOIP_MODES.get(self.geoip_mode, maxminddb.MODE_AUTO)
+                self.geoip_reader = geoip2.database.Reader(self.geoip_db_path, mode=mode)
             else:
                 print("GeoIP database not found. Geographic features will be limited.")
         except Exception as e:
             print(f"Error initializing GeoIP: {e}")
     
+    def _connect(self):
+        """Open a connection with WAL and tuned pragmas"""
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-8000')
+        return conn
+    
+    def _reader(self):
+        """Per-thread read connection, reused across requests"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+    
     def init_db(self):
         """Initialize SQLite database"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -57,43 +155,228 @@ class VisitorTracker:
                 ON visits (ip_address)
             ''')
             
+            # Summary tables maintained alongside every insert
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS visit_counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS visitor_ips (
+                    ip_address TEXT PRIMARY KEY
+                ) WITHOUT ROWID
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS visits_by_country (
+                    country_name TEXT PRIMARY KEY,
+                    country_code TEXT,
+                    visits INTEGER NOT NULL
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS visits_hourly (
+                    hour INTEGER PRIMARY KEY,
+                    visits INTEGER NOT NULL
+                )
+            ''')
+            
+            # Rollups for get_visit_analytics; the primary keys cover every query
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS visits_minutely (
+                    minute INTEGER PRIMARY KEY,
+                    visits INTEGER NOT NULL
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS visits_daily (
+                    day INTEGER PRIMARY KEY,
+                    visits INTEGER NOT NULL,
+                    sketch BLOB NOT NULL
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS visitors_hourly (
+                    hour INTEGER PRIMARY KEY,
+                    sketch BLOB NOT NULL
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS visit_dimensions (
+                    dimension TEXT NOT NULL,
+                    granularity TEXT NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    value TEXT NOT NULL,
+                    code TEXT NOT NULL,
+                    visits INTEGER NOT NULL,
+                    PRIMARY KEY (dimension, granularity, bucket, value, code)
+                ) WITHOUT ROWID
+            ''')
+            
+            cursor.execute("SELECT value FROM visit_counters WHERE name = 'total_visits'")
+            if cursor.fetchone() is None:
+                self._backfill_summaries(cursor)
+            
+            cursor.execute("SELECT value FROM visit_counters WHERE name = 'unique_visitors'")
+            if cursor.fetchone() is None:
+                cursor.execute("INSERT INTO visit_counters (name, value) SELECT 'unique_visitors', COUNT(*) FROM visitor_ips")
+            
+            cursor.execute("SELECT value FROM visit_counters WHERE name = 'rollups'")
+            if cursor.fetchone() is None:
+                self._backfill_rollups(cursor)
+            
             conn.commit()
+            self._load_counters(cursor)
             conn.close()
             
         except Exception as e:
             print(f"Error initializing database: {e}")
     
+    def _backfill_summaries(self, cursor):
+        """Build the summary tables from existing visits (one-off migration)"""
+        cursor.execute("INSERT INTO visit_counters (name, value) SELECT 'total_visits', COUNT(*) FROM visits")
+        cursor.execute('INSERT OR IGNORE INTO visitor_ips (ip_address) SELECT DISTINCT ip_address FROM visits')
+        cursor.execute('''
+            INSERT OR REPLACE INTO visits_by_country (country_name, country_code, visits)
+            SELECT country_name, MAX(country_code), COUNT(*)
+            FROM visits
+            WHERE country_name IS NOT NULL
+            GROUP BY country_name
+        ''')
+        cursor.execute('''
+            INSERT OR REPLACE INTO visits_hourly (hour, visits)
+            SELECT CAST(strftime('%s', timestamp) AS INTEGER) / 3600 AS hour, COUNT(*)
+            FROM visits
+            GROUP BY hour
+        ''')
+    
+    def _backfill_rollups(self, cursor):
+        """Build the analytics rollups from existing visits (one-off migration)"""
+        now = self._epoch(datetime.now())
+        minute_cutoff = (now - self.minute_retention) // 60
+        hour_cutoff = (now - self.hourly_retention) // 3600
+        
+        cursor.execute('''
+            INSERT OR REPLACE INTO visits_minutely (minute, visits)
+            SELECT CAST(strftime('%s', timestamp) AS INTEGER) / 60 AS minute, COUNT(*)
+            FROM visits
+            WHERE timestamp >= ?
+            GROUP BY minute
+        ''', (self._from_epoch(minute_cutoff * 60),))
+        
+        for granularity, size, since in (('day', 86400, None), ('hour', 3600, hour_cutoff)):
+            for dimension, value, code in (
+                ('country', 'country_name', 'country_code'),
+                ('city', 'city', 'country_code'),
+                ('user_agent', f"SUBSTR(user_agent, 1, {self.USER_AGENT_LENGTH})", "''")
+            ):
+                cursor.execute(f'''
+                    INSERT OR REPLACE INTO visit_dimensions (dimension, granularity, bucket, value, code, visits)
+                    SELECT ?, ?, CAST(strftime('%s', timestamp) AS INTEGER) / {size} AS bucket,
+                           {value} AS value, COALESCE({code}, '') AS code, COUNT(*)
+                    FROM visits
+                    WHERE {value} IS NOT NULL AND {value} != '' AND timestamp >= ?
+                    GROUP BY bucket, value, code
+                ''', (dimension, granularity, self._from_epoch((since or 0) * size)))
+        
+        # Sketches need every address, so they are built in one pass here
+        days = {}
+        hours = {}
+        rows = cursor.connection.execute(
+            "SELECT ip_address, CAST(strftime('%s', timestamp) AS INTEGER) FROM visits"
+        )
+        for ip_address, epoch in rows:
+            day = days.get(epoch // 86400)
+            if day is None:
+                day = days[epoch // 86400] = [0, HyperLogLog()]
+            day[0] += 1
+            day[1].add(ip_address)
+            if epoch // 3600 >= hour_cutoff:
+                hour = hours.get(epoch // 3600)
+                if hour is None:
+                    hour = hours[epoch // 3600] = HyperLogLog()
+                hour.add(ip_address)
+        
+        cursor.executemany(
+            'INSERT OR REPLACE INTO visits_daily (day, visits, sketch) VALUES (?, ?, ?)',
+            [(day, visits, sketch.to_bytes()) for day, (visits, sketch) in days.items()]
+        )
+        cursor.executemany(
+            'INSERT OR REPLACE INTO visitors_hourly (hour, sketch) VALUES (?, ?)',
+            [(hour, sketch.to_bytes()) for hour, sketch in hours.items()]
+        )
+        cursor.execute("INSERT OR REPLACE INTO visit_counters (name, value) VALUES ('rollups', 1)")
+    
+    def _load_counters(self, cursor):
+        """Load the in-memory counters from the summary tables"""
+        since_hour = self._current_hour() - 24
+        
+        # Both counts are rows kept up to date by the writer, so reading them is cheap
+        cursor.execute("SELECT name, value FROM visit_counters WHERE name IN ('total_visits', 'unique_visitors')")
+        counters = dict(cursor.fetchall())
+        total_visits = counters.get('total_visits', 0)
+        unique_visitors = counters.get('unique_visitors', 0)
+        cursor.execute('SELECT country_name, country_code, visits FROM visits_by_country')
+        country_visits = {row[0]: [row[1], row[2]] for row in cursor.fetchall()}
+        cursor.execute('SELECT hour, visits FROM visits_hourly WHERE hour > ?', (since_hour,))
+        hourly_visits = dict(cursor.fetchall())
+        
+        with self._counters_lock:
+            self._total_visits = total_visits
+            self._unique_visitors = unique_visitors
+            self._country_visits = country_visits
+            self._hourly_visits = hourly_visits
+    
+    def _epoch(self, timestamp):
+        """Seconds for a naive timestamp, matching SQLite's strftime('%s')"""
+        return calendar.timegm(timestamp.timetuple())
+    
+    def _from_epoch(self, seconds):
+        """Naive timestamp for _epoch() seconds"""
+        return datetime(1970, 1, 1) + timedelta(seconds=seconds)
+    
+    def _hour_bucket(self, timestamp):
+        """Hour bucket for a naive timestamp"""
+        return self._epoch(timestamp) // 3600
+    
+    def _current_hour(self):
+        return self._hour_bucket(datetime.now())
+    
     def track_visit(self, ip_address, user_agent=''):
         """Track a visitor and return visit statistics"""
         try:
             # Get geographic information
             geo_info = self._get_geo_info(ip_address)
             
-            # Insert visit record
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO visits (ip_address, timestamp, user_agent, country_code, 
-                                  country_name, city, latitude, longitude)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                ip_address,
-                datetime.now(),
-                user_agent,
-                geo_info.get('country_code'),
-                geo_info.get('country_name'),
-                geo_info.get('city'),
-                geo_info.get('latitude'),
-                geo_info.get('longitude')
-            ))
-            
-            conn.commit()
+            # Hand the row to the writer and wait for its group commit
+            visit = {
+                'row': (
+                    ip_address,
+                    datetime.now(),
+                    user_agent,
+                    geo_info.get('country_code'),
+                    geo_info.get('country_name'),
+                    geo_info.get('city'),
+                    geo_info.get('latitude'),
+                    geo_info.get('longitude')
+                ),
+                'done': threading.Event(),
+                'error': None
+            }
+            self._queue.put(visit)
+            if not visit['done'].wait(timeout=10):
+                raise TimeoutError('Timed out waiting for visit to be saved')
+            if visit['error']:
+                raise visit['error']
             
             # Get visitor statistics
-            stats = self._get_visitor_stats(cursor)
-            
-            conn.close()
+            stats = self.get_visitor_stats()
             
             return {
                 'total_visits': stats['total_visits'],
@@ -110,6 +393,168 @@ class VisitorTracker:
         except Exception as e:
             return {'error': str(e)}
     
+    def _write_loop(self):
+        """Insert queued visits in batched transactions"""
+        conn = None
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            try:
+                if conn is None:
+                    conn = self._connect()
+                with metrics.timed(COLLECTOR_SECONDS, COLLECTOR_ERRORS, phase='visits_insert'):
+                    self._insert_batch(conn, [visit['row'] for visit in batch])
+                if time.monotonic() - self._last_prune > 3600:
+                    self._prune_rollups(conn)
+            except Exception as e:
+                if conn is not None:
+                    conn.rollback()
+                for visit in batch:
+                    visit['error'] = e
+            
+            for visit in batch:
+                visit['done'].set()
+    
+    def _insert_batch(self, conn, rows):
+        """Insert visits and update the summary tables in one transaction"""
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT INTO visits (ip_address, timestamp, user_agent, country_code, 
+                              country_name, city, latitude, longitude)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        
+        countries = {}
+        hours = {}
+        minutes = {}
+        days = {}
+        hour_visitors = {}
+        dimensions = {}
+        for row in rows:
+            if row[4] is not None:
+                country = countries.setdefault(row[4], [row[3], 0])
+                country[1] += 1
+            epoch = self._epoch(row[1])
+            hour = epoch // 3600
+            hours[hour] = hours.get(hour, 0) + 1
+            minutes[epoch // 60] = minutes.get(epoch // 60, 0) + 1
+            day = days.setdefault(epoch // 86400, [0, set()])
+            day[0] += 1
+            day[1].add(row[0])
+            hour_visitors.setdefault(hour, set()).add(row[0])
+            
+            for dimension, value, code in (
+                ('country', row[4], row[3]),
+                ('city', row[5], row[3]),
+                ('user_agent', (row[2] or '')[:self.USER_AGENT_LENGTH], None)
+            ):
+                if not value:
+                    continue
+                for key in ((dimension, 'hour', hour, value, code or ''),
+                            (dimension, 'day', epoch // 86400, value, code or '')):
+                    dimensions[key] = dimensions.get(key, 0) + 1
+        
+        cursor.execute('''
+            INSERT INTO visit_counters (name, value) VALUES ('total_visits', ?)
+            ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+        ''', (len(rows),))
+        cursor.executemany(
+            'INSERT OR IGNORE INTO visitor_ips (ip_address) VALUES (?)',
+            [(row[0],) for row in rows]
+        )
+        new_visitors = cursor.rowcount
+        if new_visitors > 0:
+            cursor.execute('''
+                INSERT INTO visit_counters (name, value) VALUES ('unique_visitors', ?)
+                ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+            ''', (new_visitors,))
+        cursor.executemany('''
+            INSERT INTO visits_by_country (country_name, country_code, visits) VALUES (?, ?, ?)
+            ON CONFLICT(country_name) DO UPDATE SET visits = visits + excluded.visits
+        ''', [(name, code, count) for name, (code, count) in countries.items()])
+        cursor.executemany('''
+            INSERT INTO visits_hourly (hour, visits) VALUES (?, ?)
+            ON CONFLICT(hour) DO UPDATE SET visits = visits + excluded.visits
+        ''', list(hours.items()))
+        self._update_rollups(cursor, minutes, days, hour_visitors, dimensions)
+        conn.commit()
+        
+        # Only count what actually committed
+        since_hour = self._current_hour() - 24
+        with self._counters_lock:
+            self._total_visits += len(rows)
+            self._unique_visitors += new_visitors
+            for name, (code, count) in countries.items():
+                country = self._country_visits.setdefault(name, [code, 0])
+                country[1] += count
+            for hour, count in hours.items():
+                self._hourly_visits[hour] = self._hourly_visits.get(hour, 0) + count
+            for hour in [hour for hour in self._hourly_visits if hour <= since_hour]:
+                del self._hourly_visits[hour]
+    
+    def _update_rollups(self, cursor, minutes, days, hour_visitors, dimensions):
+        """Add a batch to the analytics rollups (inside the insert transaction)"""
+        cursor.executemany('''
+            INSERT INTO visits_minutely (minute, visits) VALUES (?, ?)
+            ON CONFLICT(minute) DO UPDATE SET visits = visits + excluded.visits
+        ''', list(minutes.items()))
+        cursor.executemany('''
+            INSERT INTO visit_dimensions (dimension, granularity, bucket, value, code, visits)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(dimension, granularity, bucket, value, code) DO UPDATE SET visits = visits + excluded.visits
+        ''', [key + (count,) for key, count in dimensions.items()])
+        
+        # The visits insert already holds the write lock, so this
+        # read-modify-write can't race another process's writer
+        for day, (count, addresses) in days.items():
+            cursor.execute('SELECT sketch FROM visits_daily WHERE day = ?', (day,))
+            row = cursor.fetchone()
+            sketch = HyperLogLog.from_bytes(row[0]) if row else HyperLogLog()
+            for address in addresses:
+                sketch.add(address)
+            cursor.execute('''
+                INSERT INTO visits_daily (day, visits, sketch) VALUES (?, ?, ?)
+                ON CONFLICT(day) DO UPDATE SET visits = visits + excluded.visits, sketch = excluded.sketch
+            ''', (day, count, sketch.to_bytes()))
+        
+        for hour, addresses in hour_visitors.items():
+            cursor.execute('SELECT sketch FROM visitors_hourly WHERE hour = ?', (hour,))
+            row = cursor.fetchone()
+            sketch = HyperLogLog.from_bytes(row[0]) if row else HyperLogLog()
+            for address in addresses:
+                sketch.add(address)
+            cursor.execute(
+                'INSERT OR REPLACE INTO visitors_hourly (hour, sketch) VALUES (?, ?)',
+                (hour, sketch.to_bytes())
+            )
+    
+    def _prune_rollups(self, conn):
+        """Drop minute counts and hourly rollups past their retention"""
+        try:
+            now = self._epoch(datetime.now())
+            hour_cutoff = (now - self.hourly_retention) // 3600
+            conn.execute('DELETE FROM visits_minutely WHERE minute < ?', ((now - self.minute_retention) // 60,))
+            conn.execute('DELETE FROM visitors_hourly WHERE hour < ?', (hour_cutoff,))
+            for dimension in DIMENSIONS:
+                conn.execute(
+                    "DELETE FROM visit_dimensions WHERE dimension = ? AND granularity = 'hour' AND bucket < ?",
+                    (dimension, hour_cutoff)
+                )
+            conn.commit()
+            self._last_prune = time.monotonic()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error pruning visit rollups: {e}")
+    
     def _get_geo_info(self, ip_address):
         """Get geographic information for IP address"""
         geo_info = {
@@ -120,8 +565,13 @@ class VisitorTracker:
             'longitude': None
         }
         
-        # Skip local IPs
-        if ip_address in ['127.0.0.1', 'localhost'] or ip_address.startswith('192.168.'):
+        try:
+            address = ipaddress.ip_address(ip_address)
+        except ValueError:
+            address = None
+        
+        # Skip local IPs (private, loopback, link-local, reserved, ...)
+        if ip_address == 'localhost' or (address is not None and (not address.is_global or address.is_multicast)):
             geo_info.update({
                 'country_code': 'TN',
                 'country_name': 'Tunisia',
@@ -129,96 +579,234 @@ class VisitorTracker:
             })
             return geo_info
         
+        if address is None or not self.geoip():
+            return geo_info
+        
+        cached = self.geo_cache.get(ip_address)
+        if cached is not None:
+            return dict(cached)
+        
         try:
-            if self.geoip_reader:
+            with metrics.timed(COLLECTOR_SECONDS, phase='geoip_lookup'):
                 response = self.geoip_reader.city(ip_address)
-                geo_info.update({
-                    'country_code': response.country.iso_code,
-                    'country_name': response.country.name,
-                    'city': response.city.name,
-                    'latitude': float(response.location.latitude) if response.location.latitude else None,
-                    'longitude': float(response.location.longitude) if response.location.longitude else None
-                })
+            geo_info.update({
+                'country_code': response.country.iso_code,
+                'country_name': response.country.name,
+                'city': response.city.name,
+                'latitude': float(response.location.latitude) if response.location.latitude else None,
+                'longitude': float(response.location.longitude) if response.location.longitude else None
+            })
         except geoip2.errors.AddressNotFoundError:
             pass
         except Exception as e:
             print(f"GeoIP lookup error: {e}")
+            COLLECTOR_ERRORS.inc(phase='geoip_lookup')
+            return geo_info
         
+        self.geo_cache.set(ip_address, dict(geo_info))
         return geo_info
     
-    def _get_visitor_stats(self, cursor):
-        """Get visitor statistics from database"""
-        stats = {
-            'total_visits': 0,
-            'unique_visitors': 0,
-            'recent_visits': 0,
-            'top_countries': []
-        }
+    def get_visitor_stats(self):
+        """Get visitor statistics from the in-memory counters"""
+        if self.shared:
+            try:
+                self._load_counters(self._reader().cursor())
+            except Exception as e:
+                print(f"Error loading visitor counters: {e}")
         
-        try:
-            # Total visits
-            cursor.execute('SELECT COUNT(*) FROM visits')
-            stats['total_visits'] = cursor.fetchone()[0]
-            
-            # Unique visitors
-            cursor.execute('SELECT COUNT(DISTINCT ip_address) FROM visits')
-            stats['unique_visitors'] = cursor.fetchone()[0]
-            
-            # Recent visits (last 24 hours)
-            yesterday = datetime.now() - timedelta(days=1)
-            cursor.execute('SELECT COUNT(*) FROM visits WHERE timestamp > ?', (yesterday,))
-            stats['recent_visits'] = cursor.fetchone()[0]
-            
-            # Top countries
-            cursor.execute('''
-                SELECT country_name, country_code, COUNT(*) as visit_count
-                FROM visits 
-                WHERE country_name IS NOT NULL
-                GROUP BY country_name, country_code
-                ORDER BY visit_count DESC
-                LIMIT 5
-            ''')
-            
-            stats['top_countries'] = [
-                {
-                    'name': row[0],
-                    'code': row[1],
-                    'visits': row[2]
-                }
-                for row in cursor.fetchall()
-            ]
-            
-        except Exception as e:
-            print(f"Error getting visitor stats: {e}")
+        # Recent visits: hourly buckets covering the last 24 hours
+        since_hour = self._current_hour() - 24
         
-        return stats
+        with self._counters_lock:
+            top_countries = heapq.nlargest(
+                5, self._country_visits.items(), key=lambda item: item[1][1]
+            )
+            return {
+                'total_visits': self._total_visits,
+                'unique_visitors': self._unique_visitors,
+                'recent_visits': sum(
+                    count for hour, count in self._hourly_visits.items() if hour > since_hour
+                ),
+                'top_countries': [
+                    {
+                        'name': name,
+                        'code': code,
+                        'visits': visits
+                    }
+                    for name, (code, visits) in top_countries
+                ]
+            }
     
     def get_visit_history(self, days=7):
         """Get visit history for the last N days"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            cursor = self._reader().cursor()
+            since_day = self._epoch(datetime.now()) // 86400 - days
             
-            since_date = datetime.now() - timedelta(days=days)
-            
-            cursor.execute('''
-                SELECT DATE(timestamp) as visit_date, COUNT(*) as visits
-                FROM visits 
-                WHERE timestamp > ?
-                GROUP BY DATE(timestamp)
-                ORDER BY visit_date
-            ''', (since_date,))
-            
-            history = [
+            cursor.execute('SELECT day, visits FROM visits_daily WHERE day > ? ORDER BY day', (since_day,))
+            return [
                 {
-                    'date': row[0],
-                    'visits': row[1]
+                    'date': self._from_epoch(day * 86400).date().isoformat(),
+                    'visits': visits
                 }
-                for row in cursor.fetchall()
+                for day, visits in cursor.fetchall()
             ]
             
-            conn.close()
-            return history
-            
         except Exception as e:
-            return []
\ No newline at end of file
+            return []
+    
+    def export_visits(self, start=None, end=None):
+        """Raw visits between two naive timestamps as (columns, row chunks)"""
+        columns = ('id', 'timestamp', 'ip_address', 'user_agent', 'country_code',
+                   'country_name', 'city', 'latitude', 'longitude')
+        conditions = []
+        params = []
+        if start is not None:
+            conditions.append('timestamp >= ?')
+            params.append(start)
+        if end is not None:
+            conditions.append('timestamp < ?')
+            params.append(end)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        # Unfiltered exports walk the table in rowid order instead of through the index
+        order = 'timestamp' if conditions else 'id'
+        return columns, iter_query(
+            self.db_path,
+            f"SELECT {', '.join(columns)} FROM visits {where} ORDER BY {order}",
+            params
+        )
+    
+    def get_visit_analytics(self, range_seconds, bucket='hour', top=10):
+        """Visits per bucket, unique visitors and top-N lists for the last range_seconds
+        
+        Everything comes from the rollups: counts from the minute, hour and
+        day tables, unique visitors by merging HyperLogLog sketches (an
+        estimate within a few percent) and top-N lists from visit_dimensions.
+        Whole days use the daily rollups and the partial days at either end
+        the hourly ones, so the cost depends on the range, not on how many
+        visits it holds.
+        """
+        size = BUCKET_SECONDS[bucket]
+        if range_seconds / size > MAX_BUCKETS:
+            raise ValueError(f"Range has more than {MAX_BUCKETS} {bucket} buckets; use a larger bucket")
+        if bucket == 'minute' and range_seconds > self.minute_retention:
+            raise ValueError(f"Minute buckets only cover the last {self.minute_retention} seconds")
+        
+        end = self._epoch(datetime.now())
+        start = end - int(range_seconds)
+        start_hour, end_hour = start // 3600, end // 3600
+        days, hours = self._cover(start_hour, end_hour)
+        cursor = self._reader().cursor()
+        
+        table, column = {
+            'minute': ('visits_minutely', 'minute'),
+            'hour': ('visits_hourly', 'hour'),
+            'day': ('visits_daily', 'day')
+        }[bucket]
+        first, last = start // size, end // size
+        cursor.execute(
+            f"SELECT {column}, visits FROM {table} WHERE {column} BETWEEN ? AND ?",
+            (first, last)
+        )
+        counts = dict(cursor.fetchall())
+        
+        # Per-bucket unique visitors where a sketch exists at that size
+        uniques = {}
+        if bucket in ('hour', 'day'):
+            sketch_table = 'visitors_hourly' if bucket == 'hour' else 'visits_daily'
+            cursor.execute(
+                f"SELECT {column}, sketch FROM {sketch_table} WHERE {column} BETWEEN ? AND ?",
+                (first, last)
+            )
+            uniques = {key: HyperLogLog.from_bytes(sketch).count() for key, sketch in cursor.fetchall()}
+        
+        cursor.execute('SELECT COALESCE(SUM(visits), 0) FROM visits_hourly WHERE hour BETWEEN ? AND ?',
+                       (start_hour, end_hour))
+        total_visits = cursor.fetchone()[0]
+        
+        return {
+            'range': int(range_seconds),
+            'bucket': bucket,
+            'start': self._from_epoch(start).isoformat(),
+            'end': self._from_epoch(end).isoformat(),
+            'total_visits': total_visits,
+            'unique_visitors': min(self._range_unique(cursor, days, hours), total_visits),
+            'series': [
+                {
+                    'time': self._from_epoch(key * size).isoformat(),
+                    'visits': counts.get(key, 0),
+                    # An estimate can overshoot a small exact count
+                    'unique_visitors': min(uniques.get(key, 0), counts.get(key, 0)) if bucket != 'minute' else None
+                }
+                for key in range(first, last + 1)
+            ],
+            'top_countries': [
+                {'name': value, 'code': code or None, 'visits': visits}
+                for value, code, visits in self._range_top(cursor, 'country', days, hours, top)
+            ],
+            'top_cities': [
+                {'name': value, 'country_code': code or None, 'visits': visits}
+                for value, code, visits in self._range_top(cursor, 'city', days, hours, top)
+            ],
+            'top_user_agents': [
+                {'user_agent': value, 'visits': visits}
+                for value, code, visits in self._range_top(cursor, 'user_agent', days, hours, top)
+            ]
+        }
+    
+    def _cover(self, start_hour, end_hour):
+        """Split an hour range into whole days plus the leftover hours at either end
+        
+        Returns ((first_day, last_day) or None, [(first_hour, last_hour), ...]).
+        Leftover hours older than the hourly retention are rounded out to
+        their whole day instead.
+        """
+        first_day = -(-start_hour // 24)
+        last_day = (end_hour + 1) // 24 - 1
+        if first_day > last_day:
+            return None, [(start_hour, end_hour)]
+        
+        hours = []
+        if start_hour < first_day * 24:
+            if start_hour < self._epoch(datetime.now()) // 3600 - self.hourly_retention // 3600:
+                first_day -= 1
+            else:
+                hours.append((start_hour, first_day * 24 - 1))
+        if end_hour >= (last_day + 1) * 24:
+            hours.append(((last_day + 1) * 24, end_hour))
+        return (first_day, last_day), hours
+    
+    def _range_unique(self, cursor, days, hours):
+        """Estimated unique visitors over a _cover() range"""
+        sketches = []
+        queries = [('SELECT sketch FROM visitors_hourly WHERE hour BETWEEN ? AND ?', span) for span in hours]
+        if days:
+            queries.append(('SELECT sketch FROM visits_daily WHERE day BETWEEN ? AND ?', days))
+        for query, span in queries:
+            cursor.execute(query, span)
+            sketches.extend(HyperLogLog.from_bytes(data) for (data,) in cursor.fetchall())
+        
+        sketch = HyperLogLog()
+        if sketches:
+            sketch.update(*sketches)
+        return sketch.count()
+    
+    def _range_top(self, cursor, dimension, days, hours, limit):
+        """Top values of a dimension over a _cover() range, as (value, code, visits)"""
+        totals = {}
+        spans = [('hour', span) for span in hours]
+        if days:
+            spans.append(('day', days))
+        for granularity, (first, last) in spans:
+            cursor.execute('''
+                SELECT value, code, SUM(visits)
+                FROM visit_dimensions
+                WHERE dimension = ? AND granularity = ? AND bucket BETWEEN ? AND ?
+                GROUP BY value, code
+            ''', (dimension, granularity, first, last))
+            for value, code, visits in cursor.fetchall():
+                totals[(value, code)] = totals.get((value, code), 0) + visits
+        return [
+            (value, code, visits)
+            for (value, code), visits in heapq.nlargest(limit, totals.items(), key=lambda item: item[1])
+        ]
\ No newline at end of file
@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+class WeatherService:
+    """OpenWeatherMap client with a TTL cache, coalesced fetches and stale-while-revalidate
+    
+    Fresh values are served from memory. Past the TTL the cached value is
+    still served while one background fetch refreshes it; only a city with
+    nothing usable cached makes the caller wait, and concurrent callers
+    share that single upstream request.
+    """
+    
+    def __init__(self, api_key=None, base_url=None, cities=None, ttl=None, max_stale=None,
+                 timeout=None, session=None):
+        self.api_key = api_key or os.environ.get('OPENWEATHER_API_KEY')
+        # Point at a local fake upstream for testing
+        self.base_url = (base_url or os.environ.get('OPENWEATHER_BASE_URL', 'http://api.openweathermap.org/data/2.5')).rstrip('/')
+        # OpenWeather "City,CC" names, separated by ';'; the first is the default
+        self.cities = cities or [
+            city.strip() for city in os.environ.get('WEATHER_CITIES', 'Tunis,TN').split(';') if city.strip()
+        ]
+        self.ttl = ttl or float(os.environ.get('WEATHER_TTL', 600))
+        self.max_stale = max_stale or float(os.environ.get('WEATHER_MAX_STALE', 3600))
+        self.timeout = timeout or float(os.environ.get('WEATHER_TIMEOUT', 5))
+        # After a failed fetch, wait this long before asking upstream again
+        self.retry_after = float(os.environ.get('WEATHER_RETRY_AFTER', 60))
+        
+        # Pooled keep-alive connections instead of a new one per request
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', HTTPAdapter(pool_maxsize=4))
+            session.mount('https://', HTTPAdapter(pool_maxsize=4))
+        self.session = session
+        
+        self._cache = {}
+        self._failed_at = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+    
+    def get(self, city=None):
+        """Get weather for a configured city, or {'error': ...} if none is available"""
+        city = city or self.cities[0]
+        with self._lock:
+            entry = self._cache.get(city)
+        
+        if entry is not None:
+            age = time.monotonic() - entry['fetched']
+            if age < self.ttl:
+                return entry['data']
+            if age < self.ttl + self.max_stale:
+                self._refresh_in_background(city)
+                return entry['data']
+        
+        if not self._recently_failed(city):
+            done, leader = self._begin_fetch(city)
+            if leader:
+                self._fetch(city, done)
+            else:
+                done.wait(self.timeout + 1)
+        
+        with self._lock:
+            entry = self._cache.get(city)
+            if entry is not None and time.monotonic() - entry['fetched'] < self.ttl + self.max_stale:
+                return entry['data']
+            # Upstream errors are logged, not passed on; they can contain the API key
+            return {'error': 'Weather data unavailable'}
+    
+    def _recently_failed(self, city):
+        with self._lock:
+            failed_at = self._failed_at.get(city)
+        return failed_at is not None and time.monotonic() - failed_at < self.retry_after
+    
+    def _begin_fetch(self, city):
+        """Join the in-flight fetch for a city, or register a new one; returns (event, leader)"""
+        with self._lock:
+            done = self._inflight.get(city)
+            if done is not None:
+                return done, False
+            done = self._inflight[city] = threading.Event()
+            return done, True
+    
+    def _refresh_in_background(self, city):
+        if self._recently_failed(city):
+            return
+        done, leader = self._begin_fetch(city)
+        if leader:
+            threading.Thread(target=self._fetch, args=(city, done), name='weather-refresh', daemon=True).start()
+    
+    def _fetch(self, city, done):
+        """Fetch one city from upstream and wake everyone waiting on it"""
+        try:
+            response = self.session.get(
+                f"{self.base_url}/weather",
+                params={'q': city, 'appid': self.api_key, 'units': 'metric'},
+                timeout=self.timeout
+            )
+            if response.status_code == 200:
+                data = response.json()
+                with self._lock:
+                    self._cache[city] = {
+                        'data': {
+                            'city': city,
+                            'temperature': data['main']['temp'],
+                            'description': data['weather'][0]['description'],
+                            'icon': data['weather'][0]['icon']
+                        },
+                        'fetched': time.monotonic()
+                    }
+                    self._failed_at.pop(city, None)
+            else:
+                print(f"Weather upstream returned {response.status_code} for {city}")
+                with self._lock:
+                    self._failed_at[city] = time.monotonic()
+        except Exception as e:
+            print(f"Error fetching weather for {city}: {e}")
+            with self._lock:
+                self._failed_at[city] = time.monotonic()
+        finally:
+            with self._lock:
+                self._inflight.pop(city, None)
+            done.set()
\ No newline at end of file